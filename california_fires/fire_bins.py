@@ -0,0 +1,100 @@
+# Sliding window binning of FIRMS VIIRS fire detections for the fire animations.
+#
+# Detections are sorted by time once. The detections of every window (e.g. the 24 hours before each 6 hour
+# step) are then a contiguous range of rows found with np.searchsorted, so windows overlap without copying
+# any rows. The fire radiative power of each window is summed onto a lat/lon grid, giving one small 2D
+# histogram per frame instead of raw points. All windows are held in a single sparse (windows x cells)
+# matrix, so season-long, statewide animations fit in memory; window_grid expands one frame at a time.
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+COLUMNS = ['latitude','longitude','frp','acq_date','acq_time','confidence']
+
+# VIIRS pixels are 375m, about 0.0035 degrees
+CELL_SIZE = 0.0035
+
+# Rough separation of the CZU and SCU fires
+FIRE_SPLIT_LON = -122
+
+WindowedGrid = namedtuple('WindowedGrid', ['frp', 'count', 'ends', 'lat_edges', 'lon_edges'])
+
+
+def read_detections(paths, timezone='US/Pacific'):
+    # Reads FIRMS csv exports into one frame sorted by dt, the local acquisition time
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path, usecols=COLUMNS, dtype={'acq_time': str, 'latitude': np.float32,
+                                                       'longitude': np.float32, 'frp': np.float32})
+        df['dt'] = pd.to_datetime(df['acq_date'] + ' ' + df['acq_time'], format='%Y-%m-%d %H%M')\
+                     .dt.tz_localize('UTC')\
+                     .dt.tz_convert(timezone)\
+                     .dt.tz_localize(None)
+        df = df[df['confidence'] != 'low']
+        df['fire'] = np.where(df['longitude'].values <= FIRE_SPLIT_LON, 'CZU', 'SCU')
+        df['file'] = path
+        frames.append(df.drop(['acq_date','acq_time'], axis=1))
+
+    return pd.concat(frames, ignore_index=True).sort_values(by='dt', kind='mergesort').reset_index(drop=True)
+
+
+def window_bounds(times, ends, length):
+    # First and last (exclusive) row of every window (end - length, end], both ends included as with
+    # df.loc[start:end]. times must be sorted
+    times = np.asarray(times)
+    ends = np.asarray(ends, dtype=times.dtype)
+    starts = np.searchsorted(times, ends - np.timedelta64(length), side='left')
+    stops = np.searchsorted(times, ends, side='right')
+    return starts, stops
+
+
+def window_rows(starts, stops):
+    # Window number and row number of every (window, detection) pair, without a loop over windows
+    sizes = stops - starts
+    windows = np.repeat(np.arange(len(sizes)), sizes)
+    offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return windows, np.repeat(starts, sizes) + offsets
+
+
+def grid_edges(lat, lon, cell_size=CELL_SIZE, bounds=None):
+    # Cell edges covering bounds (south, west, north, east), by default the extent of the detections
+    south, west, north, east = bounds or (lat.min(), lon.min(), lat.max(), lon.max())
+    lat_edges = south + cell_size * np.arange(int(np.ceil((north - south) / cell_size)) + 2)
+    lon_edges = west + cell_size * np.arange(int(np.ceil((east - west) / cell_size)) + 2)
+    return lat_edges, lon_edges
+
+
+def bin_windows(df, ends, length='24h', cell_size=CELL_SIZE, bounds=None):
+    # Sum of FRP and number of detections per grid cell for every window. df must be sorted by dt.
+    # Detections outside bounds are left out
+    lat = df['latitude'].values
+    lon = df['longitude'].values
+    lat_edges, lon_edges = grid_edges(lat, lon, cell_size, bounds)
+    n_lat, n_lon = len(lat_edges) - 1, len(lon_edges) - 1
+
+    # Cell of every detection, computed once however many windows it falls in
+    row = np.floor((lat - lat_edges[0]) / cell_size).astype(np.int64)
+    col = np.floor((lon - lon_edges[0]) / cell_size).astype(np.int64)
+    inside = (row >= 0) & (row < n_lat) & (col >= 0) & (col < n_lon)
+    cell = np.where(inside, row * n_lon + col, -1)
+
+    ends = pd.DatetimeIndex(ends)
+    windows, rows = window_rows(*window_bounds(df['dt'].values, ends.values, pd.Timedelta(length)))
+    keep = inside[rows]
+    windows, rows = windows[keep], rows[keep]
+
+    shape = (len(ends), n_lat * n_lon)
+    frp = sparse.csr_matrix((df['frp'].values[rows].astype(np.float32), (windows, cell[rows])), shape=shape)
+    count = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (windows, cell[rows])), shape=shape)
+    frp.sum_duplicates()
+    count.sum_duplicates()
+
+    return WindowedGrid(frp, count, ends, lat_edges, lon_edges)
+
+
+def window_grid(grid, i, values='frp'):
+    # Dense (lat, lon) array of window i, south to north
+    shape = (len(grid.lat_edges) - 1, len(grid.lon_edges) - 1)
+    return getattr(grid, values)[i].toarray().reshape(shape)
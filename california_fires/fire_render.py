@@ -0,0 +1,153 @@
+# Renders fire animations from the windowed grids of fire_bins.py.
+#
+# Frames are drawn with matplotlib's Agg backend, so no Mapbox token, browser or network is needed: each frame
+# is the FRP grid of one window, smoothed a little like the old density map, on a dark background. Frames are
+# drawn in a process pool, each worker receiving only its window's sparse row, and are written to the GIF
+# (or MP4) in order as they complete. Only a few frames are in memory at any time however long the animation.
+
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image, GifImagePlugin
+from scipy import ndimage
+from fire_bins import window_grid
+
+FRP_LABEL = 'Fire Radiative Power (MW)'
+
+# Smoothing in grid cells, roughly the radius=5 of the old density_mapbox plots
+SMOOTHING = 1.5
+
+
+class GifWriter:
+    # Appends frames to a looping GIF one at a time. Pillow's save(append_images=...) holds every frame
+    # until the end, so the header and frames are written with its GIF helpers instead, each frame with its
+    # own palette
+    def __init__(self, path, duration=500, loop=0):
+        self._f = open(path, 'wb')
+        self._duration = duration
+        self._loop = loop
+        self._started = False
+
+    def write(self, frame):
+        im = Image.fromarray(frame).convert('P', palette=Image.Palette.ADAPTIVE)
+        if not self._started:
+            header, _ = GifImagePlugin.getheader(im, info={'loop': self._loop, 'duration': self._duration})
+            self._f.write(b''.join(header))
+            self._started = True
+        for data in GifImagePlugin.getdata(im, duration=self._duration, include_color_table=True):
+            self._f.write(data)
+
+    def close(self):
+        # A GIF needs at least one frame, so without any the file is left empty
+        if self._started:
+            self._f.write(b';')
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Mp4Writer:
+    # Pipes raw RGB frames to ffmpeg, which needs to be on the PATH
+    def __init__(self, path, duration=500):
+        self._path = path
+        self._fps = 1000 / duration
+        self._process = None
+
+    def write(self, frame):
+        if self._process is None:
+            height, width = frame.shape[:2]
+            command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                       '-s', '{}x{}'.format(width, height), '-r', str(self._fps), '-i', '-',
+                       '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', self._path]
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self._process.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            if self._process.wait():
+                raise RuntimeError('ffmpeg failed writing {}'.format(self._path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_writer(path, duration=500):
+    if os.path.splitext(path)[1].lower() == '.mp4':
+        return Mp4Writer(path, duration)
+    return GifWriter(path, duration)
+
+
+def frp_upper(grid, quantile=0.80):
+    # Top of the color scale: the quantile of the non-empty cells over all windows
+    values = grid.frp.data[grid.frp.data > 0]
+    return float(np.quantile(values, quantile)) if len(values) else 1.0
+
+
+def frame_title(fire_name, end):
+    ft = datetime.strptime(str(end)[:16], '%Y-%m-%d %H:%M').strftime('%b %d, %Y - %I:%M %p PDT')
+    return '{FIRE} Fire - VIIRS 350m Satellite Image - 24H Period - {TIME}'.format(FIRE=fire_name, TIME=ft)
+
+
+def render_frame(values, extent, title, vmax, size=(1000, 700), dpi=100):
+    # Draws one window's (lat, lon) grid and returns the frame as an RGB array
+    fig = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi, facecolor='black')
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0.02, 0.02, 0.84, 0.9], facecolor='black')
+
+    # Kernel scaled to a peak of 1 as in density maps, so a lone cell keeps its FRP on the color scale
+    smoothed = ndimage.gaussian_filter(values, SMOOTHING) * 2 * np.pi * SMOOTHING ** 2 if SMOOTHING else values
+    image = ax.imshow(np.ma.masked_less_equal(smoothed, vmax * 1e-3), origin='lower', extent=extent,
+                      cmap='YlOrRd', vmin=0, vmax=vmax, interpolation='bilinear')
+    ax.set_aspect(1 / np.cos(np.radians((extent[2] + extent[3]) / 2)))
+    ax.set_axis_off()
+    ax.set_title(title, color='white', fontsize=14)
+
+    colorbar = fig.colorbar(image, cax=fig.add_axes([0.88, 0.1, 0.02, 0.75]))
+    colorbar.set_label(FRP_LABEL, color='white')
+    colorbar.ax.tick_params(colors='white')
+
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+
+def render_window(grid, i, extent, title, vmax, size, dpi):
+    return render_frame(window_grid(grid, i), extent, title, vmax, size, dpi)
+
+
+def render_animation(grid, fire_name, output, workers=None, duration=500, vmax=None, size=(1000, 700), dpi=100):
+    # Renders every window of grid in a process pool and appends the frames to output (.gif or .mp4) in
+    # order, with a few frames per worker in flight. Returns the number of frames
+    workers = workers or os.cpu_count()
+    vmax = vmax or frp_upper(grid)
+    extent = (grid.lon_edges[0], grid.lon_edges[-1], grid.lat_edges[0], grid.lat_edges[-1])
+
+    # Workers get a grid holding only their window's row
+    def window(i):
+        return grid._replace(frp=grid.frp[i], count=grid.count[i], ends=grid.ends[i:i + 1])
+
+    pending = deque()
+    with ProcessPoolExecutor(workers) as pool, open_writer(output, duration) as writer:
+        for i, end in enumerate(grid.ends):
+            pending.append(pool.submit(render_window, window(i), 0, extent, frame_title(fire_name, end),
+                                       vmax, size, dpi))
+            if len(pending) >= 2 * workers:
+                writer.write(pending.popleft().result())
+
+        while pending:
+            writer.write(pending.popleft().result())
+
+    print('Rendered {N} frames to {F}'.format(N=len(grid.ends), F=output))
+    return len(grid.ends)
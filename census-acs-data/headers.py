@@ -1,7 +1,7 @@
 # Defines a dictionary of file headers per file type.
 # Headers not in this list are truncated from final output
 
-# Note: Headers valid for ACS 2016 Data
+# Note: FILE_HEADERS and HEADER_MAP are valid for ACS 2016 Data. Other releases are registered in VINTAGES
 
 # Top Level: [DP02, DP03, DP05] Indicates the prefix of the summary file
 # Inner Levels - List of tuples:
@@ -118,4 +118,12 @@ FILE_HEADERS = {
 HEADER_MAP = {
     'P': 'HC03',
     'E': 'HC01'
-}
\ No newline at end of file
+}
+
+# Headers per ACS release, keyed by (year, product). Add an entry when a release renumbers the DP variables
+# Value: (FILE_HEADERS, HEADER_MAP) for that release
+
+VINTAGES = {
+    (2016, '1YR'): (FILE_HEADERS, HEADER_MAP),
+    (2016, '5YR'): (FILE_HEADERS, HEADER_MAP)
+}
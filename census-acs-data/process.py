@@ -5,20 +5,62 @@
 # 1. Use https://factfinder.census.gov/ to select 2016 ACS 1-year estimates & "Quick Table"
 # 2. Download DP02, DP03, DP05 to /aff_download folder in script directory
 # 3. Run script - output is saved as data_out.csv, data_out_scaled.csv, and headers_out.csv
+#
+# Batch mode: process_panel() reads every release listed in PANEL_SOURCES and appends it to a long format
+# panel (Id, Label, Year, Product, Variable, Value). Sources are folders or zip archives holding either the
+# raw DP downloads or an already processed data_out csv, and are read without extracting them
 
 import pandas as pd
 import numpy as np
 import glob
+import os
 import re
-from headers import FILE_HEADERS, HEADER_MAP
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from headers import VINTAGES
+from stats import column_stats, state_stats, zscores
 
 WORKING_DIR = 'aff_download'
 WORKING_PREFIX = 'ACS_16_1YR'
 
-def get_headers(name, include_geo=True):
+# Placeholders AFF uses for missing or not applicable estimates
+NA_VALUES = ['N', '(X)', '**']
+
+# csv, parquet or feather. The columnar formats need pyarrow and skip data_out_scaled, which can be rebuilt
+# from the mean and std in headers_out with scale_data
+OUTPUT_FORMAT = 'csv'
+
+# Estimates are stored as float32, good for about 7 significant digits. Statistics are written at that
+# precision so e.g. a min of 214.4 isn't printed as its float64 widening 214.39999389648438
+STATS_FLOAT_FORMAT = '%.7g'
+
+# Releases for the batch panel: (year, product, folder or zip archive)
+PANEL_SOURCES = [
+    (2016, '1YR', 'acs_county_data.zip'),
+    (2016, '5YR', 'acs_county_data_5yr.zip')
+]
+PANEL_FILE = 'acs_panel.csv'
+
+def get_prefix(year, product):
+    """Returns the AFF file prefix for a release, e.g. ACS_16_1YR"""
+
+    return 'ACS_{:02d}_{}'.format(year % 100, product)
+
+def get_vintage(prefix):
+    """Returns the (year, product) of an AFF file prefix"""
+
+    year, product = re.match(r'ACS_(\d{2})_(\w+)', prefix).groups()
+    return 2000 + int(year), product
+
+def get_headers(name, include_geo=True, vintage=get_vintage(WORKING_PREFIX)):
     """Returns the variable names and friendly names for an ACS file"""
 
-    file_headers =  FILE_HEADERS.get(name)
+    if vintage not in VINTAGES:
+        raise KeyError('No headers defined for ACS {} {} in headers.py'.format(*vintage))
+
+    file_headers, header_map = VINTAGES[vintage]
+    file_headers = file_headers.get(name)
 
     if include_geo:
         headers = ['GEO.id','GEO.display-label']
@@ -27,32 +69,57 @@ def get_headers(name, include_geo=True):
         headers, descriptions = [], []
 
     for v, t, n in file_headers:
-        headers.append('{}_{}'.format(HEADER_MAP.get(t), v))
+        headers.append('{}_{}'.format(header_map.get(t), v))
         descriptions.append(n)
 
     return headers, descriptions
 
-def get_data_file(filename):
+def list_files(source):
+    """Lists the files in a folder or zip archive"""
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as z:
+            return z.namelist()
+
+    return [os.path.relpath(f, source) for f in glob.glob('{}/**'.format(source), recursive=True) if os.path.isfile(f)]
+
+def read_source_csv(source, name, **kwargs):
+    """Reads a csv from a folder or directly from a zip archive"""
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as z, z.open(name) as f:
+            return pd.read_csv(f, **kwargs)
+
+    return pd.read_csv(os.path.join(source, name), **kwargs)
+
+def get_data_file(filename, source=WORKING_DIR, prefix=WORKING_PREFIX):
     """Parses an ACS data file"""
 
-    file_type = re.findall('DP\d{2}', filename)[0]
-    file_headers, short_names = get_headers(file_type)
+    file_type = re.findall(r'DP\d{2}', filename)[0]
+    file_headers, short_names = get_headers(file_type, vintage=get_vintage(prefix))
 
-    df = pd.read_csv(filename, skiprows=[1], encoding='iso-8859-1', usecols=file_headers)
+    dtypes = {h: np.float32 for h in file_headers[2:]}
+    df = read_source_csv(source, filename, skiprows=[1], encoding='iso-8859-1', usecols=file_headers, dtype=dtypes, na_values=NA_VALUES)
     df.columns = short_names
     df = df.set_index(['Id','Label'])
 
     return df
 
-def get_header_file(filename):
+@lru_cache(maxsize=None)
+def get_metadata(file_type, source=WORKING_DIR, prefix=WORKING_PREFIX):
+    """Reads the ACS metadata file for a file type once per run"""
+
+    filename = [f for f in list_files(source) if os.path.basename(f) == '{}_{}_metadata.csv'.format(prefix, file_type)][0]
+    return read_source_csv(source, filename, header=0, names=['Variable','LongDescription'], encoding='iso-8859-1')
+
+def get_header_file(filename, source=WORKING_DIR, prefix=WORKING_PREFIX):
     """Parses an ACS metadata file"""
 
-    file_type = re.findall('DP\d{2}', filename)[0]
-    file_headers, header_names = get_headers(file_type, include_geo=False)
-    
+    file_type = re.findall(r'DP\d{2}', filename)[0]
+    file_headers, header_names = get_headers(file_type, include_geo=False, vintage=get_vintage(prefix))
 
-    df = pd.read_csv('{}/{}_{}_metadata.csv'.format(WORKING_DIR, WORKING_PREFIX, file_type), header=0, names=['Variable','LongDescription'], encoding='iso-8859-1')
-    df = df[df.Variable.isin([v for v in file_headers])]
+    df = get_metadata(file_type, source, prefix)
+    df = df[df.Variable.isin([v for v in file_headers])].copy()
 
     df['ShortDescription'] = header_names
     df['File'] = file_type
@@ -60,31 +127,123 @@ def get_header_file(filename):
 
     return df
 
-def process_files():
-    """Process all files in the data directory"""
+def get_data_files(source=WORKING_DIR, prefix=WORKING_PREFIX):
+    """Lists the DP data files of a release within a folder or zip archive"""
 
-    data_files = glob.glob('{}/{}*with_ann.csv'.format(WORKING_DIR, WORKING_PREFIX))
+    return sorted(f for f in list_files(source) if re.match(r'{}_DP\d{{2}}_with_ann.csv'.format(prefix), os.path.basename(f)))
 
-    final_data = pd.DataFrame()
-    final_headers = pd.DataFrame()
+def read_data_files(data_files, workers=1, source=WORKING_DIR, prefix=WORKING_PREFIX):
+    """Parses ACS data files, in a process pool when more than one worker is requested"""
 
-    print('Processing {} files'.format(len(data_files)))
-    for file in data_files:
-        final_data = pd.concat([final_data, get_data_file(file)], axis=1)
-        final_headers = pd.concat([final_headers, get_header_file(file)])
+    if workers > 1 and len(data_files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(get_data_file, data_files, [source] * len(data_files), [prefix] * len(data_files)))
+
+    return [get_data_file(file, source, prefix) for file in data_files]
+
+def scale_data(data, headers):
+    """Standardizes data with the per-column mean and std stored in the headers output. Header rows are in the
+    same order as the data columns"""
 
-    final_data = final_data.replace('N', np.nan).astype(float)
-    data_summary = final_data.describe().transpose().reset_index().rename(columns={'index': 'ShortDescription'})
-    final_headers = final_headers.reset_index().merge(data_summary, on=['ShortDescription']).set_index(['File','Variable'])
+    return pd.DataFrame(zscores(data.values, headers), index=data.index, columns=data.columns)
 
-    final_data.to_csv('data_out.csv')
-    final_headers.to_csv('headers_out.csv')
+def write_output(data, headers, states, output_format=OUTPUT_FORMAT):
+    """Saves the merged data, headers and state summary, plus the scaled data for csv output"""
+
+    if output_format == 'csv':
+        data.to_csv('data_out.csv')
+        headers.to_csv('headers_out.csv', float_format=STATS_FLOAT_FORMAT)
+        states.to_csv('state_stats_out.csv', index=False, float_format=STATS_FLOAT_FORMAT)
+        scale_data(data, headers).to_csv('data_out_scaled.csv')
+    elif output_format in ['parquet', 'feather']:
+        getattr(data.reset_index(), 'to_{}'.format(output_format))('data_out.{}'.format(output_format))
+        getattr(headers.reset_index(), 'to_{}'.format(output_format))('headers_out.{}'.format(output_format))
+        getattr(states, 'to_{}'.format(output_format))('state_stats_out.{}'.format(output_format))
+    else:
+        raise ValueError('Unknown output format {}'.format(output_format))
 
-    def scale(x):
-        return (x - x.mean()) / x.std()
+def read_output(output_format='parquet'):
+    """Loads the data and headers written by write_output in a columnar format"""
 
-    final_data.apply(scale).to_csv('data_out_scaled.csv')
+    data = getattr(pd, 'read_{}'.format(output_format))('data_out.{}'.format(output_format)).set_index(['Id','Label'])
+    headers = getattr(pd, 'read_{}'.format(output_format))('headers_out.{}'.format(output_format)).set_index(['File','Variable'])
+    return data, headers
+
+def process_files(workers=1, source=WORKING_DIR, prefix=WORKING_PREFIX, output_format=OUTPUT_FORMAT):
+    """Process all files in the data directory"""
+
+    data_files = get_data_files(source, prefix)
+
+    print('Processing {} files'.format(len(data_files)))
+    final_data = pd.concat(read_data_files(data_files, workers, source, prefix), axis=1)
+    final_headers = pd.concat([get_header_file(file, source, prefix) for file in data_files])
+
+    # Header rows line up with the data columns, so the summary is attached by position
+    if list(final_headers['ShortDescription']) != list(final_data.columns):
+        raise ValueError('Metadata variables do not match the data columns')
+
+    data_summary = column_stats(final_data.values).set_index(final_headers.index)
+    final_headers = pd.concat([final_headers, data_summary], axis=1)
+
+    write_output(final_data, final_headers, state_stats(final_data), output_format)
     print('Processing complete!')
 
+def get_release_data(year, product, source, workers=1):
+    """Returns the wide (Id, Label) x variable data of one release from raw DP files or a processed data_out csv"""
+
+    prefix = get_prefix(year, product)
+    data_files = get_data_files(source, prefix)
+
+    if data_files:
+        return pd.concat(read_data_files(data_files, workers, source, prefix), axis=1)
+
+    processed = [f for f in list_files(source) if re.match(r'data_out(_\w+)?\.csv$', os.path.basename(f)) and 'scaled' not in f]
+    if not processed:
+        raise FileNotFoundError('No {} DP files or data_out csv found in {}'.format(prefix, source))
+
+    # Only keep the variables defined for this release
+    names = [n for file_headers in VINTAGES[(year, product)][0].values() for _, _, n in file_headers]
+    data = read_source_csv(source, processed[0], encoding='iso-8859-1', index_col=['Id','Label'])
+    return data[[c for c in data.columns if c in names]].astype(np.float32)
+
+def to_panel(data, year, product):
+    """Melts wide release data into the long panel format"""
+
+    panel = data.reset_index().melt(id_vars=['Id','Label'], var_name='Variable', value_name='Value').dropna(subset=['Value'])
+    panel.insert(2, 'Year', year)
+    panel.insert(3, 'Product', product)
+    return panel[['Id','Label','Year','Product','Variable','Value']]
+
+def process_panel(sources=PANEL_SOURCES, panel_file=PANEL_FILE, replace=False, workers=1):
+    """Appends every release in sources to the long format panel. Releases already in the panel are skipped
+    unless replace is set, in which case they are rebuilt"""
+
+    releases = {(year, product) for year, product, _ in sources}
+    done = set()
+
+    if os.path.exists(panel_file):
+        if replace:
+            panel = pd.read_csv(panel_file, encoding='iso-8859-1', dtype={'Id': str})
+            keep = ~pd.Series(list(zip(panel['Year'], panel['Product']))).isin(releases).values
+            panel[keep].to_csv(panel_file, index=False, encoding='iso-8859-1')
+        else:
+            existing = pd.read_csv(panel_file, usecols=['Year','Product'], encoding='iso-8859-1').drop_duplicates()
+            done = set(zip(existing['Year'], existing['Product']))
+
+    for year, product, source in sources:
+        if (year, product) in done:
+            print('Skipping ACS {} {}, already in {}'.format(year, product, panel_file))
+            continue
+
+        print('Adding ACS {} {} from {}'.format(year, product, source))
+        panel = to_panel(get_release_data(year, product, source, workers), year, product)
+
+        write_header = not os.path.exists(panel_file)
+        panel.to_csv(panel_file, mode='a', header=write_header, index=False, encoding='iso-8859-1')
+        done.add((year, product))
+
+    print('Panel complete!')
+
 
-process_files()
\ No newline at end of file
+if __name__ == '__main__':
+    process_files(workers=os.cpu_count())
@@ -0,0 +1,108 @@
+# Summary statistics for the merged ACS data, computed on the raw NumPy array instead of per column pandas
+# calls. Missing estimates (NaN) are ignored throughout. All results are positional: row i of a summary
+# describes column i of the data, so they can be attached to the headers without merging on names.
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = [0.25, 0.5, 0.75]
+
+def get_state(ids):
+    """Returns the 2 digit state FIPS code from GEO.id values such as 0500000US01003"""
+
+    return pd.Series(ids).str.split('US').str[1].str[:2].values
+
+def column_stats(values, quantiles=QUANTILES):
+    """Returns count, mean, std, min, quantiles and max per column in the layout of DataFrame.describe"""
+
+    values = np.asarray(values)
+    count = (~np.isnan(values)).sum(axis=0)
+    n = np.maximum(count, 1)
+
+    # A single sort per column gives min, max and every quantile. NaN sorts to the end of each column
+    ordered = np.sort(values, axis=0)
+    cols = np.arange(values.shape[1])
+
+    def at_quantile(q):
+        # Linear interpolation between the closest ranks, as pandas does
+        pos = q * (n - 1)
+        lo = np.floor(pos).astype(int)
+        hi = np.ceil(pos).astype(int)
+        low, high = ordered[lo, cols].astype(np.float64), ordered[hi, cols].astype(np.float64)
+        return low + (high - low) * (pos - lo)
+
+    mean = np.nansum(values, axis=0, dtype=np.float64) / n
+    var = np.nansum((values - mean) ** 2, axis=0, dtype=np.float64) / np.maximum(count - 1, 1)
+
+    stats = {'count': count.astype(np.float64), 'mean': mean, 'std': np.sqrt(var), 'min': at_quantile(0)}
+    for q in quantiles:
+        stats['{:g}%'.format(q * 100)] = at_quantile(q)
+    stats['max'] = at_quantile(1)
+
+    # Columns without any values have no statistics
+    stats = pd.DataFrame(stats)
+    stats.loc[count == 0, stats.columns[1:]] = np.nan
+    stats.loc[count == 1, 'std'] = np.nan
+    return stats
+
+def group_stats(values, groups, weights=None):
+    """Returns count, mean, std, min and max per group and column. Rows of the result are (group, column)
+    pairs in the order of np.unique(groups) and the data columns. With weights, mean and std are weighted
+    (frequency weights, so unit weights give the unweighted result)"""
+
+    keys, codes = np.unique(groups, return_inverse=True)
+    n_cols = values.shape[1]
+
+    # Sort rows by group once, then reduce each contiguous group block
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(keys)))
+    values = np.asarray(values, dtype=np.float64)[order]
+
+    present = ~np.isnan(values)
+    w = np.ones(len(values)) if weights is None else np.nan_to_num(np.asarray(weights, dtype=np.float64)[order])
+    w = np.where(present, w[:, None], 0)
+    x = np.where(present, values, 0)
+
+    # Every group is a non-empty block of rows, so sums reduce in place like min and max
+    sizes = np.diff(np.r_[starts, len(values)])
+
+    def group_sum(a):
+        return np.add.reduceat(a, starts, axis=0)
+
+    count = group_sum(present.astype(np.float64))
+    total_w = group_sum(w)
+    mean = group_sum(w * x) / np.where(total_w > 0, total_w, np.nan)
+    deviation = np.where(present, x - np.repeat(mean, sizes, axis=0), 0)
+    var = group_sum(w * deviation ** 2) / np.where(total_w > 1, total_w - 1, np.nan)
+
+    low = np.fmin.reduceat(values, starts, axis=0)
+    high = np.fmax.reduceat(values, starts, axis=0)
+
+    return pd.DataFrame({
+        'group': np.repeat(keys, n_cols),
+        'column': np.tile(np.arange(n_cols), len(keys)),
+        'count': count.ravel(),
+        'mean': mean.ravel(),
+        'std': np.sqrt(var).ravel(),
+        'min': low.ravel(),
+        'max': high.ravel()
+    })
+
+def zscores(values, stats):
+    """Standardizes each column with the mean and std of its positional summary row"""
+
+    return (np.asarray(values) - stats['mean'].values) / stats['std'].values
+
+def state_stats(data, weight='PopTotal'):
+    """Per state summary of every variable, with PopTotal weighted means and std alongside the plain ones"""
+
+    states = get_state(data.index.get_level_values('Id'))
+    stats = group_stats(data.values, states)
+
+    if weight in data.columns:
+        weighted = group_stats(data.values, states, weights=data[weight].values)
+        stats['weighted_mean'] = weighted['mean'].values
+        stats['weighted_std'] = weighted['std'].values
+
+    stats.insert(1, 'ShortDescription', data.columns.values[stats['column'].values])
+    return stats.drop('column', axis=1).rename(columns={'group': 'State'})
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import mongomock
+import pytest
+
+# visits.py sits next to the notebooks rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from visits import MapsApi, MongoDb, ResponseCache
+
+
+@pytest.fixture
+def db():
+	return MongoDb('maps_project', 'coffee', client=mongomock.MongoClient(), batch_size=2)
+
+
+class PlacesHandler(BaseHTTPRequestHandler):
+	# Answers with server.respond(endpoint, params), a JSON serializable dict
+	def log_message(self, *args):
+		pass
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		endpoint = url.path.split('/')[-2]
+		params = {k: v[0] for k, v in parse_qs(url.query).items() if k != 'key'}
+		self.server.requests.append((endpoint, params))
+
+		body = json.dumps(self.server.respond(endpoint, params)).encode()
+		self.send_response(200)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+
+@pytest.fixture
+def places_server():
+	server = ThreadingHTTPServer(('127.0.0.1', 0), PlacesHandler)
+	server.requests = []
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+
+@pytest.fixture
+def api(tmp_path, places_server, db):
+	keypath = tmp_path / 'key'
+	keypath.write_text('test-key')
+	api = MapsApi(str(keypath), 'coffee', backend=db, api_url='http://127.0.0.1:{}'.format(places_server.server_port),
+				  workers=2, requests_per_second=1000, cache=ResponseCache(str(tmp_path / 'cache.sqlite')))
+
+	# No waiting for page tokens or retries
+	api._sleep_pagenation = 0
+	api._retry_backoff = 0
+	return api
@@ -0,0 +1,103 @@
+import pytest
+from visits import ApiError
+
+
+def details(params):
+	return {'status': 'OK', 'result': {'place_id': params['place_id'], 'url': 'http://maps/' + params['place_id']}}
+
+
+def test_not_found_details_are_skipped(api, db, places_server):
+	def respond(endpoint, params):
+		if params['place_id'] == 'gone':
+			return {'status': 'NOT_FOUND'}
+		return details(params)
+	places_server.respond = respond
+
+	db.add([{'place_id': p} for p in ['a', 'gone', 'b']])
+	api.append_details()
+
+	assert db.count_missing_url() == 1
+	assert db.with_url(['a', 'b', 'gone']) == {'a', 'b'}
+
+
+def test_fetched_urls_are_written_when_a_request_fails(api, db, places_server):
+	def respond(endpoint, params):
+		if params['place_id'] == 'denied':
+			return {'status': 'REQUEST_DENIED', 'error_message': 'Key revoked'}
+		return details(params)
+	places_server.respond = respond
+
+	api._workers = 1
+	db.add([{'place_id': p} for p in ['a', 'b', 'denied', 'c']])
+	with pytest.raises(ApiError):
+		api.append_details()
+
+	assert db.with_url(['a', 'b']) == {'a', 'b'}
+
+
+def test_over_query_limit_is_retried(api, places_server):
+	responses = iter([{'status': 'OVER_QUERY_LIMIT', 'results': []}] * 2 +
+					 [{'status': 'OK', 'results': [{'place_id': 'a'}]}])
+	places_server.respond = lambda endpoint, params: next(responses)
+
+	assert api.get_nearby(store=False, location='37.7,-122.4', radius=1000, keyword='coffee') == [{'place_id': 'a'}]
+	assert len(places_server.requests) == 3
+
+
+def test_page_token_not_yet_valid_is_retried(api, places_server):
+	tries = []
+
+	def respond(endpoint, params):
+		if 'pagetoken' not in params:
+			return {'status': 'OK', 'results': [{'place_id': 'a'}], 'next_page_token': 'token'}
+		tries.append(1)
+		if len(tries) < 3:
+			return {'status': 'INVALID_REQUEST', 'results': []}
+		return {'status': 'OK', 'results': [{'place_id': 'b'}]}
+	places_server.respond = respond
+
+	results = api.get_nearby(store=False, location='37.7,-122.4', radius=1000, keyword='coffee')
+	assert [r['place_id'] for r in results] == ['a', 'b']
+
+
+def test_errors_are_not_empty_searches(api, places_server):
+	places_server.respond = lambda endpoint, params: {'status': 'OVER_QUERY_LIMIT', 'results': []}
+
+	with pytest.raises(ApiError):
+		api.get_nearby(store=False, location='37.7,-122.4', radius=1000, keyword='coffee')
+	assert len(places_server.requests) == api._retries + 1
+
+
+def paginated(endpoint, params):
+	# Two pages, each token valid once
+	if 'pagetoken' in params:
+		return {'status': 'OK', 'results': [{'place_id': 'b'}]}
+	return {'status': 'OK', 'results': [{'place_id': 'a'}], 'next_page_token': 'token'}
+
+
+def test_paginated_search_is_cached_whole(api, places_server):
+	places_server.respond = paginated
+	search = dict(location='37.7,-122.4', radius=1000, keyword='coffee')
+
+	assert [r['place_id'] for r in api.get_nearby(store=False, **search)] == ['a', 'b']
+	assert len(places_server.requests) == 2
+
+	# A rerun is served from the cache without replaying the spent page token
+	assert [r['place_id'] for r in api.get_nearby(store=False, **search)] == ['a', 'b']
+	assert len(places_server.requests) == 2
+
+
+def test_search_with_failed_page_is_not_cached(api, places_server):
+	def respond(endpoint, params):
+		if 'pagetoken' in params:
+			return {'status': 'REQUEST_DENIED', 'results': []}
+		return paginated(endpoint, params)
+	places_server.respond = respond
+	search = dict(location='37.7,-122.4', radius=1000, keyword='coffee')
+
+	with pytest.raises(ApiError):
+		api.get_nearby(store=False, **search)
+
+	places_server.respond = paginated
+	assert [r['place_id'] for r in api.get_nearby(store=False, **search)] == ['a', 'b']
+	assert [params.get('pagetoken') for _, params in places_server.requests[-2:]] == [None, 'token']
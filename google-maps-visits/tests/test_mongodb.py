@@ -0,0 +1,45 @@
+import mongomock
+import pymongo
+import pytest
+from pymongo import UpdateOne
+
+
+def test_duplicates_in_batch_are_merged(db):
+	db.add([
+		{'place_id': 'a', 'name': 'Cafe A'},
+		{'place_id': 'a', 'url': 'http://maps/a'},
+		{'place_id': 'b', 'name': 'Cafe B'},
+		{'place_id': 'c', 'name': 'Cafe C'},
+		{'place_id': 'a', 'rating': 4.5},
+	])
+
+	docs = {d['place_id']: d for d in db._client.find({}, {'_id': 0})}
+	assert sorted(docs) == ['a', 'b', 'c']
+	assert docs['a'] == {'place_id': 'a', 'name': 'Cafe A', 'url': 'http://maps/a', 'rating': 4.5}
+
+
+def test_place_id_index_is_unique(db):
+	db.add([{'place_id': 'a', 'name': 'Cafe A'}])
+
+	indexes = db._client.index_information()
+	assert any(index['key'] == [('place_id', 1)] and index.get('unique') for index in indexes.values())
+	with pytest.raises(pymongo.errors.DuplicateKeyError):
+		db._client.insert_one({'place_id': 'a'})
+
+	# Upserting the same place again updates it in place
+	db._client.bulk_write([UpdateOne({'place_id': 'a'}, {'$set': {'name': 'Cafe A2'}}, upsert=True)], ordered=False)
+	assert db._client.count_documents({'place_id': 'a'}) == 1
+
+
+def test_find_missing_url(db):
+	db.add([
+		{'place_id': 'a', 'name': 'Cafe A', 'url': 'http://maps/a'},
+		{'place_id': 'b', 'name': 'Cafe B'},
+		{'place_id': 'c', 'name': 'Cafe C'},
+	])
+
+	cursor = db.find_missing_url()
+	assert isinstance(cursor, mongomock.collection.Cursor)
+	assert sorted(cursor, key=lambda r: r['place_id']) == [{'place_id': 'b'}, {'place_id': 'c'}]
+	assert db.count_missing_url() == 2
+	assert db.with_url(['a', 'b', 'x']) == {'a'}
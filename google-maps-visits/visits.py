@@ -1,34 +1,233 @@
-class MongoDb:
-	from pymongo import MongoClient
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic, sleep, time
+from urllib.parse import urlencode
+
+import requests
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from requests.adapters import HTTPAdapter
+
+# Nearby search returns at most 3 pages of 20 results and searches at most 50km around a point
+RESULT_CAP = 60
+MAX_RADIUS = 50000
+EARTH_RADIUS = 6371000
+
+# Statuses worth retrying after a pause. INVALID_REQUEST is only retried for page tokens, which are rejected
+# until a short while after they were issued
+RETRY_STATUSES = ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+
+# Seconds before a cached response is fetched again. Place lists change faster than place details
+CACHE_TTLS = {
+	'nearbysearch': 24 * 3600,
+	'details': 30 * 24 * 3600
+}
+
+
+def distance(lat1, lng1, lat2, lng2):
+	# Great circle distance in meters
+	lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+	a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+	return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def cell_center(cell):
+	south, west, north, east = cell
+	return (south + north) / 2, (west + east) / 2
+
 
-	def __init__(self, db, collection):
+def cell_radius(cell):
+	# Radius of the circle around the cell center that covers the whole cell
+	south, west, north, east = cell
+	lat, lng = cell_center(cell)
+	return max(distance(lat, lng, corner_lat, corner_lng) for corner_lat in (south, north) for corner_lng in (west, east))
+
+
+def split_cell(cell):
+	south, west, north, east = cell
+	lat, lng = cell_center(cell)
+	return [(south, west, lat, lng), (south, lng, lat, east), (lat, west, north, lng), (lat, lng, north, east)]
+
+
+def plan_cells(bounds, max_radius=MAX_RADIUS):
+	# Splits the (south, west, north, east) bounds until every cell can be covered by a single search
+	cells, planned = [bounds], []
+	while cells:
+		cell = cells.pop()
+		if cell_radius(cell) > max_radius:
+			cells.extend(split_cell(cell))
+		else:
+			planned.append(cell)
+	return planned
+
+
+class ApiError(Exception):
+	pass
+
+
+class MongoDb:
+	def __init__(self, db, collection, client=None, batch_size=1000):
+		# client can be any MongoClient compatible object, e.g. mongomock.MongoClient() for testing
 		self._db = db
 		self._collection = collection
-		self._client = MongoClient()[db][collection]
+		self._batch_size = batch_size
+		self._client = (client or MongoClient())[db][collection]
+		self._client.create_index([('place_id', ASCENDING)], unique=True)
 
 	def add(self, records):
+		# Upsert in batches of unordered bulk writes. Records for the same place are merged first, since
+		# two upserts of one place_id in the same unordered batch can collide on the unique index
+		batch = {}
 		for r in records:
-			self._client.update_one({'place_id': r['place_id']}, {'$set': r}, upsert=True)
+			batch.setdefault(r['place_id'], {}).update(r)
+			if len(batch) >= self._batch_size:
+				self.__write(batch)
+				batch = {}
+
+		if batch:
+			self.__write(batch)
+
+	def __write(self, batch):
+		ops = [UpdateOne({'place_id': place_id}, {'$set': r}, upsert=True) for place_id, r in batch.items()]
+		self._client.bulk_write(ops, ordered=False)
+
+	def count_missing_url(self):
+		return self._client.count_documents({'url': {'$exists': False}})
+
+	def with_url(self, place_ids):
+		# The subset of place_ids already stored with a URL, in one query
+		found = self._client.find({'place_id': {'$in': list(place_ids)}, 'url': {'$exists': True}}, {'place_id': 1, '_id': 0})
+		return {r['place_id'] for r in found}
 
 	def find_missing_url(self):
-		return list(self._client.find({'url': {'$exists': False}}))
+		# Streams the place_id of every record without a URL instead of loading whole documents
+		return self._client.find({'url': {'$exists': False}}, {'place_id': 1, '_id': 0}, batch_size=self._batch_size)
 
 
-class MapsApi:
-	import json
-	import requests
+class ResponseCache:
+	# SQLite cache of API responses keyed by endpoint and request parameters (never the API key). Responses
+	# older than the TTL of their endpoint are fetched again; endpoints without a TTL are kept forever.
+	# In replay mode nothing is fetched and a request missing from the cache raises KeyError
+	def __init__(self, path='maps_cache.sqlite', ttls=CACHE_TTLS, replay=False):
+		self._ttls = ttls
+		self._replay = replay
+		self._lock = threading.Lock()
+		self._conn = sqlite3.connect(path, check_same_thread=False)
+		self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, created REAL, body TEXT)')
+		self._conn.commit()
+
+	@staticmethod
+	def key(endpoint, params):
+		return json.dumps({'endpoint': endpoint, 'params': params}, sort_keys=True, default=str)
+
+	def get(self, endpoint, params):
+		with self._lock:
+			row = self._conn.execute('SELECT created, body FROM responses WHERE key = ?', (self.key(endpoint, params),)).fetchone()
+
+		ttl = self._ttls.get(endpoint)
+		if row is not None and (self._replay or ttl is None or time() - row[0] <= ttl):
+			return json.loads(row[1])
+
+		if self._replay:
+			raise KeyError('No cached response for {} {}'.format(endpoint, params))
+		return None
+
+	def put(self, endpoint, params, data):
+		# Errors such as OVER_QUERY_LIMIT or a page token that isn't valid yet must be retried, not cached
+		if data.get('status', 'OK') not in ('OK', 'ZERO_RESULTS'):
+			return
+
+		with self._lock:
+			self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+							   (self.key(endpoint, params), endpoint, time(), json.dumps(data)))
+			self._conn.commit()
+
+
+class TokenBucket:
+	# Rate limiter shared by all worker threads: on average rate requests per second, in bursts of up to
+	# capacity requests
+	def __init__(self, rate, capacity=None):
+		self._rate = rate
+		self._capacity = capacity or rate
+		self._tokens = self._capacity
+		self._updated = monotonic()
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self._lock:
+				now = monotonic()
+				self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+				self._updated = now
+
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				wait_time = (1 - self._tokens) / self._rate
+
+			sleep(wait_time)
+
+
+def run_bounded(pool, next_job, limit):
+	# Runs jobs from next_job() on the pool, at most limit at a time, and yields (key, result) as they
+	# complete. next_job returns a (key, function, kwargs) tuple or None when there is nothing to start. It is
+	# called again after each result has been handled, so jobs can be added based on earlier results
+	pending = {}
 
-	def __init__(self, keypath, search_keyword):
-		self._api_url = 'https://maps.googleapis.com/maps/api/place'
+	def submit():
+		job = next_job()
+		if job is not None:
+			key, func, kwargs = job
+			pending[pool.submit(func, **kwargs)] = key
+		return job is not None
+
+	while len(pending) < limit and submit():
+		pass
+
+	while pending:
+		done, _ = wait(pending, return_when=FIRST_COMPLETED)
+		for future in done:
+			key = pending.pop(future)
+			yield key, future.result()
+			while len(pending) < limit and submit():
+				pass
+
+
+class MapsApi:
+	def __init__(self, keypath, search_keyword, backend=None, api_url='https://maps.googleapis.com/maps/api/place',
+				 workers=8, requests_per_second=10, cache=None):
+		self._api_url = api_url
 		self._api_format = 'json'
-		self._backend = MongoDb('maps_project', 'coffee')
+		self._backend = backend or MongoDb('maps_project', 'coffee')
 		self._sleep_pagenation = 2
+		self._retries = 4
+		self._retry_backoff = 2
+		self._write_batch = 100
 		self._search_keyword = search_keyword
+		self._workers = workers
+		self._cache = cache or ResponseCache()
+		self._request_counts = Counter()
+		self._count_lock = threading.Lock()
+
+		# One pooled session for all threads, throttled to the API quota
+		self._limiter = TokenBucket(requests_per_second)
+		self._session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+		self._session.mount('https://', adapter)
+		self._session.mount('http://', adapter)
 		
 		with open(keypath) as f:
-			self._api_key = f.read()
+			self._api_key = f.read().strip()
+
+	def __get_reponse(self, endpoint, use_cache=True, **kwargs):
+		if use_cache:
+			data = self._cache.get(endpoint, kwargs)
+			if data is not None:
+				return data
 
-	def __get_reponse(self, endpoint, **kwargs):
 		url = '{BASE}/{ENDPOINT}/{FORMAT}?{ARGS}&key={KEY}'.format(
 			BASE=self._api_url,
 			ENDPOINT=endpoint,
@@ -36,62 +235,184 @@ class MapsApi:
 			ARGS=urlencode(kwargs),
 			KEY=self._api_key
 			)
-		return json.loads(requests.get(url).content)
+		for attempt in range(self._retries + 1):
+			self._limiter.acquire()
+			with self._count_lock:
+				self._request_counts[endpoint] += 1
+			data = self._session.get(url, timeout=30).json()
+
+			status = data.get('status', 'OK')
+			retry = status in RETRY_STATUSES or (status == 'INVALID_REQUEST' and 'pagetoken' in kwargs)
+			if not retry or attempt == self._retries:
+				break
+			print('{} from {}. Retrying in {}s'.format(status, endpoint, self._retry_backoff * 2 ** attempt))
+			sleep(self._retry_backoff * 2 ** attempt)
+
+		# NOT_FOUND is left to the caller, e.g. details of a place that was removed
+		if status not in ('OK', 'ZERO_RESULTS', 'NOT_FOUND'):
+			raise ApiError('{} from {}: {}'.format(status, endpoint, data.get('error_message', kwargs)))
 
-	def get_nearby(self, **kwargs):
+		if use_cache:
+			self._cache.put(endpoint, kwargs, data)
+		return data
+
+	def get_nearby(self, store=True, **kwargs):
+		# Returns every result of the search. Page tokens only work once, so the search is cached as a whole,
+		# after all of its pages were fetched, rather than page by page
+		data = self._cache.get('nearbysearch', kwargs)
+
+		# Entries cached page by page held a first page with a now expired token
+		if data is None or 'next_page_token' in data:
+			data = self.__get_pages(kwargs)
+			self._cache.put('nearbysearch', kwargs, data)
+
+		results = data['results']
+		if store:
+			self._backend.add(results)
+		return results
+
+	def __get_pages(self, params):
+		# A next_page_token only becomes valid a short while after it is issued, so the follow-up requests
+		# are the only ones that wait
 		key = 'results'
-		data = self.__get_reponse('nearbysearch', **kwargs)
-		self._backend.add(data['results'])
+		data = self.__get_reponse('nearbysearch', use_cache=False, **params)
+		results = list(data[key])
 
 		while 'next_page_token' in data.keys():
 			print('Additional page found. Waiting {}ms'.format(self._sleep_pagenation*1000))
 			sleep(self._sleep_pagenation)
 
-			params = {
-				'pagetoken': data['next_page_token']
-			}
-			data = self.__get_reponse('nearbysearch', **kwargs)
-			self._backend.add(data[key])
+			data = self.__get_reponse('nearbysearch', use_cache=False, pagetoken=data['next_page_token'])
+			results.extend(data[key])
 
-	def get_nearby_many(self, points):
-		count = len(points)
+		return {'status': data.get('status', 'OK'), key: results}
 
-		i = 1
-		for point in points:
-			print('Sweeping point {} of {}'.format(i, count))
+	def get_nearby_many(self, points, details=False):
+		# Searches 50km around each of the points
+		searches = [(None, {'location': point, 'radius': MAX_RADIUS, 'keyword': self._search_keyword}) for point in points]
+		return self.__crawl(searches, details)
+
+	def sweep(self, bounds, details=False, max_depth=8):
+		# Covers the (south, west, north, east) bounds starting from cells as large as a single search allows.
+		# Cells whose search hits the result cap may hold more places than were returned, so only those are
+		# split into quarters and searched again, down to max_depth levels
+		def cell_search(cell, depth):
+			lat, lng = cell_center(cell)
 			params = {
-				'location': point,
-				'radius': 50000,
+				'location': '{},{}'.format(lat, lng),
+				'radius': int(math.ceil(cell_radius(cell))),
 				'keyword': self._search_keyword
 			}
-			search_nearby(**params)
-			sleep(self._sleep_pagenation)
-			i+=1
+			return (cell, depth), params
+
+		def expand(key, results):
+			cell, depth = key
+			if len(results) < RESULT_CAP or depth >= max_depth:
+				return []
+			return [cell_search(c, depth + 1) for c in split_cell(cell)]
+
+		searches = [cell_search(cell, 0) for cell in plan_cells(bounds)]
+		return self.__crawl(searches, details, expand)
+
+	def __crawl(self, searches, details, expand=None):
+		# Runs the searches with a pool of workers and stores every place once. expand(key, results) may return
+		# further (key, params) searches. With details, the URL of every new place is fetched while the
+		# remaining searches are still running. Returns a report of the requests used per unique place
+		searches = deque(searches)
+		count = len(searches)
+		details_queue = []
+		seen = set()
+		start_counts = Counter(self._request_counts)
+
+		def next_job():
+			# Details waiting for a worker go first so they run between the remaining searches
+			if details_queue:
+				return details_queue.pop()
+			if not searches:
+				return None
+			key, params = searches.popleft()
+			return ('search', key), self.get_nearby, dict(params, store=False)
+
+		# URLs already fetched are written even if a request fails
+		records = []
+		i = 1
+		try:
+			with ThreadPoolExecutor(self._workers) as pool:
+				for (kind, key), result in run_bounded(pool, next_job, self._workers):
+					if kind == 'search':
+						print('Searched {} of {}'.format(i, count))
+						i += 1
+
+						# Places already found by an overlapping search are neither stored nor looked up again
+						new = {r['place_id']: r for r in result if r['place_id'] not in seen}
+						seen.update(new)
+						self._backend.add(new.values())
+
+						if expand is not None:
+							more = expand(key, result)
+							searches.extend(more)
+							count += len(more)
+
+						if details and new:
+							for place_id in set(new) - self._backend.with_url(new):
+								details_queue.append((('details', None), self.get_url, {'place_id': place_id}))
+					elif result is not None:
+						records.append(result)
+						if len(records) >= self._write_batch:
+							self._backend.add(records)
+							records = []
+		finally:
+			self._backend.add(records)
+
+		used = self._request_counts - start_counts
+		report = {
+			'searches': count,
+			'nearby_requests': used['nearbysearch'],
+			'details_requests': used['details'],
+			'places': len(seen),
+			'requests_per_place': sum(used.values()) / max(len(seen), 1)
+		}
+		print('{} requests for {} unique places ({:.2f} per place)'.format(sum(used.values()), len(seen),
+			  report['requests_per_place']))
+		return report
+
+	def get_url(self, place_id):
+		# None if the place no longer exists
+		details = self.get_details(place_id=place_id)
+		if details is None:
+			return None
+		return {
+			'place_id': place_id,
+			'url': details['url']
+		}
 
 	def get_details(self, **kwargs):
 		key = 'result'    
 		data = self.__get_reponse('details', **kwargs)
+		if data.get('status') == 'NOT_FOUND':
+			print('No details found for {}'.format(kwargs))
+			return None
 		return data[key]
 
 	def append_details(self):
-		missing_records = self._backend.find_missing_url()
-		count = len(missing_records)
+		count = self._backend.count_missing_url()
 
 		print('Updating {} records without URL'.format(count))
-		i = 1
-		for r in missing_records:
-			params = {
-				'place_id': r['place_id']
-			}
-			details = self.get_details(**params)
+		jobs = (('details', self.get_url, {'place_id': r['place_id']}) for r in self._backend.find_missing_url())
 
-			record = {
-				'place_id': place['place_id'],
-				'url': details['url']
-			}
-			self._backend.add([record])
-
-			print('Added record {} of {}. Sleeping {}ms'.format(i, count, self._sleep_pagenation))
-			sleep(self._sleep_pagenation)
+		# URLs already fetched are written even if a request fails
+		records = []
+		i = 1
+		try:
+			with ThreadPoolExecutor(self._workers) as pool:
+				for _, record in run_bounded(pool, lambda: next(jobs, None), self._workers):
+					if record is not None:
+						records.append(record)
+					if len(records) >= self._write_batch:
+						self._backend.add(records)
+						records = []
 
-			i += 1
+					print('Added record {} of {}'.format(i, count))
+					i += 1
+		finally:
+			self._backend.add(records)
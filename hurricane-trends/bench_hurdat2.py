@@ -0,0 +1,138 @@
+# Benchmarks the columnar HURDAT2 parser against the original line-by-line loader and checks that both
+# produce the same DataFrame.
+#
+# Usage:
+#   python bench_hurdat2.py                  # synthetic archive, 2000 storms
+#   python bench_hurdat2.py hurdat2.txt      # local copy of a HURDAT2 file
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from hurricane import HURDAT2_HEADERS, STORM_STATUS, parse_hurdat2
+
+
+def parse_hurdat2_loop(text):
+    # Original per-line implementation from load_hurdat2_data, kept here as the baseline
+    data = text.split('\n')[:-1]
+    headers = list(HURDAT2_HEADERS)
+
+    storm_data = []
+    for k,v in enumerate(data):
+        row_split = v.split(',')
+
+        if len(row_split) == 4:
+            storm_code = row_split[0].strip()
+            storm_name = row_split[1].strip()
+        else:
+            data_row = '{},{},{}'.format(storm_code, storm_name, v).split(',')[:-1]
+            storm_data.append(data_row)
+
+    df = pd.DataFrame(storm_data, columns=headers).set_index('code')
+    df = df.apply(lambda x: x.str.strip())
+
+    df['datetime'] = pd.to_datetime(df.date + df.time, format='%Y%m%d%H%M')
+    df.drop(['date','time'], axis=1, inplace=True)
+    df['year'] = df['datetime'].dt.year
+    df['month'] = df['datetime'].dt.month
+
+    storm_status = STORM_STATUS
+    df['status_rank'] = df['storm_status'].apply(lambda x: storm_status.index(x))
+
+    def convert_geo(x):
+        sign = -1 if x[-1] in ['S','W'] else 1
+
+        return float(x[:-1]) * sign
+
+    df['latitude'] = df['latitude'].apply(convert_geo)
+    df['longitude'] = df['longitude'].apply(convert_geo)
+
+    for col in [c for c in df.columns if c.split('_')[0] in ['max','min','wind']]:
+        df[col] = pd.to_numeric(df[col]).replace([-99,-999], np.nan)
+
+    def wind_category(x):
+        if x>=137:
+            return 5
+        elif x>=113:
+            return 4
+        elif x>=96:
+            return 3
+        elif x>=83:
+            return 2
+        elif x>=64:
+            return 1
+        else:
+            return np.nan
+
+    df['status_cat'] = df['max_wind'].apply(wind_category)
+
+    df_agg = df.groupby('code')[[c for c in df.columns if c.split('_')[0] in ['max','wind','status']]].max()
+    df_agg['min_pressure'] = df.groupby('code')['min_pressure'].min()
+
+    df_agg.columns = ['agg_{}'.format(c) for c in df_agg.columns]
+    df = df.merge(df_agg, left_index=True, right_index=True).reset_index()
+
+    for w in ['34','50','64']:
+        cols = [c for c in df.columns if 'agg_wind_{}kt_'.format(w) in c]
+        df['agg_maxwind_{}kt_tot'.format(w)] = df[cols].max(axis=1)
+
+    return df
+
+
+def synthetic_hurdat2(n_storms, seed=0):
+    # Builds a HURDAT2 formatted archive with realistic field widths and missing value markers
+    rng = np.random.RandomState(seed)
+    lines = []
+
+    for i in range(n_storms):
+        year = 1851 + i // 20
+        n_rows = rng.randint(5, 60)
+        lines.append('{:>8},{:>19},{:>7},'.format('AL{:02d}{}'.format(i % 20 + 1, year), 'STORM{}'.format(i), n_rows))
+
+        start = pd.Timestamp('{}-06-01'.format(year)) + pd.Timedelta(int(rng.randint(0, 120)), 'D')
+        for j in range(n_rows):
+            t = start + pd.Timedelta(6 * j, 'h')
+            wind = rng.randint(15, 160)
+            pressure = rng.choice([-999, rng.randint(900, 1015)])
+            radii = [rng.choice([-999, 0, rng.randint(10, 300)]) for _ in range(12)]
+            lat = rng.uniform(-30, 50)
+            lon = rng.uniform(-100, 10)
+
+            row = [
+                t.strftime('%Y%m%d'), ' {}'.format(t.strftime('%H%M')), rng.choice(['  ', ' L']),
+                ' {}'.format(rng.choice(STORM_STATUS)),
+                '{:>5}{}'.format('{:.1f}'.format(abs(lat)), 'N' if lat >= 0 else 'S'),
+                '{:>6}{}'.format('{:.1f}'.format(abs(lon)), 'E' if lon >= 0 else 'W'),
+                '{:>4}'.format(wind), '{:>5}'.format(pressure)
+            ] + ['{:>5}'.format(r) for r in radii]
+            lines.append(','.join(row) + ',')
+
+    return '\n'.join(lines) + '\n'
+
+
+def time_call(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            text = f.read()
+    else:
+        text = synthetic_hurdat2(2000)
+
+    t_loop, df_loop = time_call(parse_hurdat2_loop, text)
+    t_columnar, df_columnar = time_call(parse_hurdat2, text)
+
+    pd.testing.assert_frame_equal(df_loop, df_columnar)
+
+    print('Rows: {}'.format(len(df_columnar)))
+    print('Loop parser:     {:.3f}s'.format(t_loop))
+    print('Columnar parser: {:.3f}s'.format(t_columnar))
+    print('Speedup:         {:.1f}x'.format(t_loop / t_columnar))
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+# Columnar on-disk cache for processed DataFrames.
+#
+# Every entry is a directory named after a hash of the source file, the request parameters and a schema
+# version, so changing any of them produces a different entry instead of returning stale data. Each column
+# is stored as its own .npy file and loaded with a copy-on-write memory map: warm loads only read metadata
+# and several processes reading the same entry share the OS page cache rather than holding a copy each.
+# String columns are stored as integer codes plus their unique values.
+#
+# The total size of the cache directory is capped. Reading an entry refreshes its timestamp and the least
+# recently used entries are removed first when the cap is exceeded.
+
+CACHE_DIR = 'cache'
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+META_FILE = 'meta.json'
+
+
+def cache_key(source, schema_version, **params):
+    payload = json.dumps({'source': source, 'schema': schema_version, 'params': params},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def read_cache(key, cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, key)
+    meta_path = os.path.join(path, META_FILE)
+
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    columns = {}
+    for i, col in enumerate(meta['columns']):
+        values = np.load(os.path.join(path, '{}.npy'.format(i)), mmap_mode='c')
+
+        if col['kind'] == 'codes':
+            values = pd.Categorical.from_codes(values, categories=col['categories']).astype(object)
+
+        columns[i] = values
+
+    df = pd.DataFrame(columns, copy=False)
+    df.columns = [col['name'] for col in meta['columns']]
+
+    if meta['index'] is not None:
+        df.index = np.load(os.path.join(path, 'index.npy'), mmap_mode='c')
+        df.index.name = meta['index']['name']
+
+    # Mark the entry as recently used
+    os.utime(meta_path)
+    return df
+
+
+def write_cache(key, df, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    # Write into a temporary directory first so readers never see a partial entry
+    tmp_path = os.path.join(cache_dir, '.tmp-{}'.format(uuid.uuid4().hex))
+    os.makedirs(tmp_path)
+
+    meta = {'columns': [], 'index': None}
+    for i, name in enumerate(df.columns):
+        values = df.iloc[:, i]
+        col = {'name': name.item() if isinstance(name, np.generic) else name, 'kind': 'array'}
+
+        if values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            col.update(kind='codes', categories=list(uniques))
+            values = codes.astype(np.int32)
+        else:
+            values = values.values
+
+        np.save(os.path.join(tmp_path, '{}.npy'.format(i)), values)
+        meta['columns'].append(col)
+
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        np.save(os.path.join(tmp_path, 'index.npy'), df.index.values)
+        meta['index'] = {'name': df.index.name}
+
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+    evict(cache_dir, max_bytes)
+
+
+def entry_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        meta_path = os.path.join(entry.path, META_FILE)
+        if entry.is_dir() and os.path.isfile(meta_path):
+            entries.append((os.stat(meta_path).st_mtime, entry_size(entry.path), entry.path))
+
+    # Remove least recently used entries until the cache fits
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        print('Evicting cache entry {}'.format(os.path.basename(path)))
+        shutil.rmtree(path)
+        total -= size
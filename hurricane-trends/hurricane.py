@@ -1,180 +1,452 @@
-import pickle
+import hashlib
 import os
+import re
+import time
 import urllib.request as req
 import numpy as np
 import pandas as pd
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from cache import CACHE_DIR, cache_key, read_cache, write_cache
 
-def load_hurdat2_data(hurdat_file):  
-    base_url = 'http://www.nhc.noaa.gov/data/hurdat/{}'.format(hurdat_file)
-    filedir = 'cache'
-    filename = '{}/hurdat2.p'.format(filedir)
-    
-    # Load from cache if file already exists
-    if os.path.isfile(filename):
-        print('Reading cached HURDAT2')
-        with open(filename, 'rb') as f:
-            return pickle.load(f)
-        
-    with req.urlopen(base_url) as response:
-        print('Downloading HURDAT2 file - {}'.format(hurdat_file))
-        data = response.read().decode('utf-8').split('\n')[:-1]
-
-    print('Processing HURDAT2')
-    # Create headers per http://www.nhc.noaa.gov/data/hurdat/hurdat2-format-atlantic.pdf
-    headers = [
-        'code','name','date','time','record_identifier','storm_status','latitude','longitude','max_wind',
-        'min_pressure'
-    ]
-    
-    # Create headers for the 3 wind speeds x 4 quadrent columns
-    for w in ['34','50','64']:
-        for q in ['ne','se','sw','nw']:
-            headers.append('wind_{}kt_{}'.format(w, q))
-    
-    # Loop through each row, when encountering a header row, pull out the storm code and name
-    # Strip out newline delimiter at end
-    storm_data = []
-    for k,v in enumerate(data):
-        row_split = v.split(',')
-        
-        if len(row_split) == 4:
-            storm_code = row_split[0].strip()
-            storm_name = row_split[1].strip()
-        else:
-            data_row = '{},{},{}'.format(storm_code, storm_name, v).split(',')[:-1]
-            storm_data.append(data_row)
-            
-    df = pd.DataFrame(storm_data, columns=headers).set_index('code')
-    df = df.apply(lambda x: x.str.strip())
-      
-    # Convert date-time to single pandas column
-    df['datetime'] = pd.to_datetime(df.date + df.time, format='%Y%m%d%H%M')
+# Create headers per http://www.nhc.noaa.gov/data/hurdat/hurdat2-format-atlantic.pdf
+# along with the 3 wind speeds x 4 quadrent columns
+HURDAT2_HEADERS = [
+    'code','name','date','time','record_identifier','storm_status','latitude','longitude','max_wind',
+    'min_pressure'
+] + ['wind_{}kt_{}'.format(w, q) for w in ['34','50','64'] for q in ['ne','se','sw','nw']]
+
+# Ordinal ranking for the storm status
+STORM_STATUS = ['DB','WV','LO','EX','SD','SS','TD','TS','HU']
+
+# Storm header rows start with the basin and storm code, e.g. AL011851; data rows start with a date
+STORM_HEADER = re.compile(r'^([A-Z]{2}\d{6}),', re.MULTILINE)
+
+# A single storm from the streaming reader. track holds one typed array per column of parse_tracks
+Storm = namedtuple('Storm', ['code','name','basin','year','track'])
+
+# Saffir-Simpson lower bounds (kt) for categories 5 down to 1
+WIND_CATEGORIES = [(137, 5), (113, 4), (96, 3), (83, 2), (64, 1)]
+
+# Extended Reconstructed Sea Surface Temperature (ERSST) yearly files, kept locally once downloaded
+ERSST_URL = 'https://www1.ncdc.noaa.gov/pub/data/cmb/ersst/v5/ascii/ersst.v5.{}.asc'
+ERSST_DIR = os.path.join(CACHE_DIR, 'ersst')
+
+# ERSST grid coordinates, 2 degree spacing. Longitude increases eastward from 0 to 358
+ERSST_LATS = np.arange(-88, 90, 2)
+ERSST_LONS = np.arange(0, 360, 2)
+
+# Bump these whenever the processed output changes so older cache entries are no longer used
+HURDAT2_SCHEMA_VERSION = 1
+ERSST_SCHEMA_VERSION = 3
+
+
+def parse_hurdat2(text):
+    # Parse a HURDAT2 archive into one row per track point along with the peak values of each storm
+    return add_storm_peaks(parse_tracks(text))
+
+
+def parse_tracks(text):
+    # Read every line into the same 20 column grid. Header rows only fill the first 3 fields, so any row
+    # without a latitude is a header. Storm code and name are then forward filled onto the data rows.
+    # The measurement columns are parsed as numbers by the reader itself
+    raw = pd.read_csv(StringIO(text), header=None, names=range(21), usecols=range(20),
+                      dtype={c: str for c in range(6)}, skipinitialspace=True,
+                      keep_default_na=False, na_values={c: [''] for c in range(6, 20)})
+    is_header = (raw[4] == '').values
+
+    code = raw.loc[is_header, 0].str.strip().reindex(raw.index).ffill()
+    name = raw.loc[is_header, 1].str.strip().reindex(raw.index).ffill()
+
+    df = raw[~is_header]
+    df.columns = HURDAT2_HEADERS[2:]
+    df.insert(0, 'name', name[~is_header])
+    df.insert(0, 'code', code[~is_header])
+    df = df.reset_index(drop=True)
+
+    # Convert date-time to single pandas column from the integer YYYYMMDD and HHMM fields
+    date = pd.to_numeric(df.date).values
+    time = pd.to_numeric(df.time).values
+    df['datetime'] = pd.to_datetime(pd.DataFrame({
+        'year': date // 10000, 'month': date // 100 % 100, 'day': date % 100,
+        'hour': time // 100, 'minute': time % 100
+    }))
     df.drop(['date','time'], axis=1, inplace=True)
     df['year'] = df['datetime'].dt.year
     df['month'] = df['datetime'].dt.month
-    
-    # Add an ordinal ranking for the storm status
-    storm_status = ['DB','WV','LO','EX','SD','SS','TD','TS','HU']
-    df['status_rank'] = df['storm_status'].apply(lambda x: storm_status.index(x))
-        
-    # Lat/lon to decimal values
-    def convert_geo(x):
-        sign = -1 if x[-1] in ['S','W'] else 1
-        
-        return float(x[:-1]) * sign
-        
-    # Convert coordinates from N/W string
-    df['latitude'] = df['latitude'].apply(convert_geo)
-    df['longitude'] = df['longitude'].apply(convert_geo)
-    
-
-    # Convert columns to numeric remove -999 or -99
+
+    status = pd.Categorical(df['storm_status'], categories=STORM_STATUS)
+    if (status.codes < 0).any():
+        raise ValueError('Unknown storm status: {}'.format(set(df['storm_status'][status.codes < 0])))
+    df['status_rank'] = status.codes.astype(np.int64)
+
+    # Convert coordinates from N/W string to decimal values
+    df['latitude'] = decode_geo(df['latitude'].values)
+    df['longitude'] = decode_geo(df['longitude'].values)
+
+    # Remove -999 or -99. Columns without missing values stay integer, as pd.to_numeric would leave them
     for col in [c for c in df.columns if c.split('_')[0] in ['max','min','wind']]:
-        df[col] = pd.to_numeric(df[col]).replace([-99,-999], np.NaN)
-        
+        df[col] = df[col].replace([-99,-999], np.nan)
+        if not df[col].hasnans:
+            df[col] = df[col].astype(np.int64)
+
     # Add hurricane wind category
-    def wind_category(x):
-        if x>=137:
-            return 5
-        elif x>=113:
-            return 4
-        elif x>=96:
-            return 3
-        elif x>=83:
-            return 2
-        elif x>=64:
-            return 1
-        else:
-            return np.NaN
-        
-    df['status_cat'] = df['max_wind'].apply(wind_category)
-        
-    # Calculate peak values and join back to main
-    df_agg = df.groupby('code')[[c for c in df.columns if c.split('_')[0] in ['max','wind','status']]].max()
-    df_agg['min_pressure'] = df.groupby('code')['min_pressure'].min()
-    
-    df_agg.columns = ['agg_{}'.format(c) for c in df_agg.columns]
-    df = df.merge(df_agg, left_index=True, right_index=True).reset_index()
+    df['status_cat'] = np.select([df['max_wind'] >= w for w, _ in WIND_CATEGORIES],
+                                 [c for _, c in WIND_CATEGORIES], default=np.nan)
+
+    return df
+
+
+def decode_geo(values):
+    # Works on the raw bytes of the strings, e.g. b'100.5W': the last character of each row gives the
+    # hemisphere and is blanked out so the remaining digits convert straight to float
+    raw = np.asarray(values).astype('S8')
+    chars = raw.view(np.uint8).reshape(len(raw), 8)
+    rows = np.arange(len(raw))
+    last = (chars != 0).sum(axis=1) - 1
+
+    hemisphere = chars[rows, last].copy()
+    chars[rows, last] = 0
+    sign = np.where(np.isin(hemisphere, [ord('S'), ord('W')]), -1, 1)
+
+    return raw.astype(float) * sign
+
+
+def add_storm_peaks(df):
+    groups = df.groupby('code', sort=False)
+    peak_cols = [c for c in df.columns if c.split('_')[0] in ['max','wind','status']]
+
+    peaks = groups[peak_cols].transform('max')
+    peaks['min_pressure'] = groups['min_pressure'].transform('min')
+    peaks.columns = ['agg_{}'.format(c) for c in peaks.columns]
+
+    # Rows are ordered by storm code, matching the original index merge
+    df = pd.concat([df, peaks], axis=1).sort_values('code', kind='stable').reset_index(drop=True)
 
     for w in ['34','50','64']:
         cols = [c for c in df.columns if 'agg_wind_{}kt_'.format(w) in c]
         df['agg_maxwind_{}kt_tot'.format(w)] = df[cols].max(axis=1)
-           
-    # Cache the merged file 
-    if not os.path.exists(filedir):
-        os.makedirs(filedir)
-        
-    with open(filename, 'wb') as f:
-        pickle.dump(df, f)
-    
+
+    return df
+
+
+def iter_storm_lines(source):
+    # Group the lines of a file or HTTP response by storm without reading the whole archive. Yields the
+    # storm code, name and its lines, header row included
+    lines = []
+    code = name = None
+
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+
+        match = STORM_HEADER.match(line)
+        if match:
+            if lines:
+                yield code, name, lines
+            code = match.group(1)
+            name = line.split(',')[1].strip()
+            lines = []
+
+        if line.strip():
+            lines.append(line if line.endswith('\n') else line + '\n')
+
+    if lines:
+        yield code, name, lines
+
+
+def parse_storm_batch(batch):
+    # Parse a batch of (code, name, lines) in one columnar pass and split the columns back into storms.
+    # Track arrays are views into the batch arrays
+    tracks = parse_tracks(''.join(line for _, _, lines in batch for line in lines))
+    columns = {c: tracks[c].values for c in tracks.columns if c not in ['code','name']}
+    ends = np.cumsum([len(lines) - 1 for _, _, lines in batch])
+
+    for (code, name, _), start, end in zip(batch, np.r_[0, ends[:-1]], ends):
+        yield Storm(code, name, code[:2], int(code[4:]),
+                    {c: values[start:end] for c, values in columns.items()})
+
+
+def read_storms(source, basins=None, years=None, batch_size=500):
+    # Stream storms from a file or HTTP response, parsing batch_size storms at a time so memory stays flat
+    # regardless of archive size. Storms outside the basins (e.g. ['AL']) or years are skipped before any
+    # parsing. The result is a generator and can be chained with further filters before building a frame
+    batch = []
+    for code, name, lines in iter_storm_lines(source):
+        if basins is not None and code[:2] not in basins:
+            continue
+        if years is not None and int(code[4:]) not in years:
+            continue
+
+        batch.append((code, name, lines))
+        if len(batch) == batch_size:
+            yield from parse_storm_batch(batch)
+            batch = []
+
+    if batch:
+        yield from parse_storm_batch(batch)
+
+
+def storms_frame(storms):
+    # Build the parse_hurdat2 DataFrame, peaks included, from an iterable of storms
+    codes, names, columns = [], [], {}
+    for storm in storms:
+        n = len(storm.track['datetime'])
+        codes.append(np.repeat(storm.code, n))
+        names.append(np.repeat(storm.name, n))
+        for c, values in storm.track.items():
+            columns.setdefault(c, []).append(values)
+
+    df = pd.DataFrame({c: np.concatenate(values) for c, values in columns.items()})
+    df.insert(0, 'name', np.concatenate(names).astype(object))
+    df.insert(0, 'code', np.concatenate(codes).astype(object))
+    return add_storm_peaks(df)
+
+
+def split_storm_blocks(text):
+    # Cut the archive into one block of text per storm, header row included
+    matches = list(STORM_HEADER.finditer(text))
+    ends = [m.start() for m in matches[1:]] + [len(text)]
+
+    return pd.DataFrame({
+        'code': [m.group(1) for m in matches],
+        'block': [text[m.start():end] for m, end in zip(matches, ends)]
+    })
+
+
+def storm_hashes(blocks):
+    hashes = [hashlib.sha1(b.encode('utf-8')).hexdigest() for b in blocks['block']]
+    return pd.DataFrame({'code': blocks['code'].values, 'hash': hashes})
+
+
+def refresh_hurdat2(df, hashes, text):
+    # Compare storm blocks against the hashes of the previous release and only parse storms that are new or
+    # changed. Storm peaks are computed per storm, so the untouched rows can be kept as they are
+    blocks = split_storm_blocks(text)
+    new_hashes = storm_hashes(blocks)
+
+    merged = new_hashes.merge(hashes, on='code', how='left', suffixes=('', '_old'))
+    changed = merged['code'][merged['hash'] != merged['hash_old']]
+    removed = hashes['code'][~hashes['code'].isin(new_hashes['code'])]
+    print('Refreshing {} changed and {} removed storms'.format(len(changed), len(removed)))
+
+    keep = df[~df['code'].isin(changed) & ~df['code'].isin(removed)]
+    if len(changed) > 0:
+        updated = parse_hurdat2(''.join(blocks['block'][blocks['code'].isin(changed)]))
+        keep = pd.concat([keep, updated], ignore_index=True)
+
+    df = keep.sort_values('code', kind='stable').reset_index(drop=True)
+    return df, new_hashes
+
+
+def hurdat2_series(hurdat_file):
+    # Releases of the same archive only differ by their dates, e.g. hurdat2-1851-2016-041117.txt
+    return re.sub(r'-\d+', '', hurdat_file)
+
+
+def load_hurdat2_data(hurdat_file, use_cache=True, incremental=True):
+    base_url = 'http://www.nhc.noaa.gov/data/hurdat/{}'.format(hurdat_file)
+    key = cache_key(hurdat_file, HURDAT2_SCHEMA_VERSION)
+
+    # Storm hashes of the latest processed release of this archive, used for incremental refreshes
+    series_key = cache_key(hurdat2_series(hurdat_file), HURDAT2_SCHEMA_VERSION, kind='storm_hashes')
+
+    # Load from cache if this file was already processed
+    if use_cache:
+        df = read_cache(key)
+        if df is not None:
+            print('Reading cached HURDAT2')
+            return df
+
+    with req.urlopen(base_url) as response:
+        print('Downloading HURDAT2 file - {}'.format(hurdat_file))
+        data = response.read().decode('utf-8')
+
+    # Start from the previous release when it is still cached
+    df = None
+    if use_cache and incremental:
+        hashes = read_cache(series_key)
+        if hashes is not None:
+            df = read_cache(cache_key(hashes['source'].iloc[0], HURDAT2_SCHEMA_VERSION))
+
+    if df is not None:
+        print('Processing HURDAT2 changes since {}'.format(hashes['source'].iloc[0]))
+        df, hashes = refresh_hurdat2(df, hashes[['code','hash']], data)
+    else:
+        print('Processing HURDAT2')
+        df = parse_hurdat2(data)
+        hashes = storm_hashes(split_storm_blocks(data))
+
+    # Cache the merged file along with its storm hashes
+    write_cache(key, df)
+    hashes['source'] = hurdat_file
+    write_cache(series_key, hashes)
+
     print('HURDAT2 Complete')
     return df
 
 
-def load_ersst_data(year_start, year_end, bounding_box=None, use_cache=True):
+def ersst_filename(year, base_url=ERSST_URL, filedir=ERSST_DIR):
+    return os.path.join(filedir, os.path.basename(base_url.format(year)))
+
+
+def ersst_is_cached(year, base_url=ERSST_URL, filedir=ERSST_DIR):
+    # The current year's file gains a month at a time so it is always fetched again
+    return os.path.isfile(ersst_filename(year, base_url, filedir)) and year < pd.Timestamp.now().year
+
+
+def download_ersst_year(year, base_url=ERSST_URL, filedir=ERSST_DIR, retries=3, backoff=2):
+    # Files already on disk are reused so an interrupted download only fetches the missing years
+    filename = ersst_filename(year, base_url, filedir)
+    if ersst_is_cached(year, base_url, filedir):
+        return filename
+
+    for attempt in range(retries + 1):
+        try:
+            with req.urlopen(base_url.format(year), timeout=60) as response:
+                content = response.read()
+            break
+        except OSError as e:
+            if attempt == retries:
+                raise
+            print('Retrying year {} after error: {}'.format(year, e))
+            time.sleep(backoff ** attempt)
+
+    # Write under a temporary name so a partial file is never mistaken for a complete year
+    os.makedirs(filedir, exist_ok=True)
+    tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_filename, filename)
+
+    print('Downloaded year {}'.format(year))
+    return filename
+
+
+def download_ersst(years, base_url=ERSST_URL, filedir=ERSST_DIR, max_workers=8):
+    # Fetch the yearly files in parallel, returning local file names in the order of years
+    years = list(years)
+    missing = [yr for yr in years if not ersst_is_cached(yr, base_url, filedir)]
+    print('Downloading {} of {} ERSST years'.format(len(missing), len(years)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda yr: download_ersst_year(yr, base_url, filedir), years))
+
+
+def grid_window(bounding_box, lats=ERSST_LATS, lons=ERSST_LONS):
+    # Map a bounding box onto array offsets of a (lat, lon) grid. Bounding box should be two tuples, top left
+    # and bottom right point. Note that latitude goes from -88 to +88 as expected, but longitude increases
+    # from 0 to 358 EASTWARD. A range like 250-360 would roughly cover the Northern Atlantic.
+    # The returned slices index the grid directly, so several regions can be cut from one loaded cube
+    # without copying it
+    if bounding_box is None:
+        return slice(0, len(lats)), slice(0, len(lons))
+
+    (top, left), (bottom, right) = bounding_box
+    lat_slice = slice(np.searchsorted(lats, bottom, side='left'), np.searchsorted(lats, top, side='right'))
+    lon_slice = slice(np.searchsorted(lons, left, side='left'), np.searchsorted(lons, right, side='right'))
+    return lat_slice, lon_slice
+
+
+def subset_cube(cube, bounding_box, lats=ERSST_LATS, lons=ERSST_LONS):
+    # Returns a view of the cube limited to the bounding box along with its coordinates
+    lat_slice, lon_slice = grid_window(bounding_box, lats, lons)
+    return cube[:, lat_slice, lon_slice], lats[lat_slice], lons[lon_slice]
+
+
+def decode_ersst(text, bounding_box=None):
+    # Decode one yearly ERSST file straight into a float32 (month, lat, lon) grid. The file holds 180
+    # longitude rows of 89 latitude values per month, one row per line, written as fixed width integers in
+    # 0.01 C with -9999 marking land/ice. See https://www1.ncdc.noaa.gov/pub/data/cmb/ersst/v5/ascii/Readme
+    lat_slice, lon_slice = grid_window(bounding_box)
+
+    # Only the lines of the bounding box's longitudes are parsed
+    if bounding_box is not None:
+        lines = text.splitlines()
+        text = '\n'.join(line for start in range(0, len(lines), len(ERSST_LONS))
+                         for line in lines[start + lon_slice.start:start + lon_slice.stop])
+
+    values = np.fromstring(text, dtype=np.float32, sep=' ')
+    grid = values.reshape(-1, len(ERSST_LONS[lon_slice]), len(ERSST_LATS)).transpose(0, 2, 1)[:, lat_slice]
+
+    # Latitudes are cut as a view, so only the cells inside the bounding box are scaled and copied
+    grid = np.where(grid == -9999, np.float32(np.nan), grid / np.float32(100))
+    return np.ascontiguousarray(grid)
+
+
+def load_ersst_cube(year_start, year_end, bounding_box=None, max_workers=8):
+    # Returns a float32 cube of shape (months, lat, lon) limited to the bounding box, a frame with the year
+    # and month of each slice, and the latitudes and longitudes of the cube
+    years = range(year_start, year_end+1)
+    filenames = download_ersst(years, max_workers=max_workers)
+    lat_slice, lon_slice = grid_window(bounding_box)
+    lats, lons = ERSST_LATS[lat_slice], ERSST_LONS[lon_slice]
+
+    # Fill a preallocated cube year by year so only one copy of the record is ever held
+    cube = np.empty((len(years) * 12, len(lats), len(lons)), dtype=np.float32)
+    times = []
+    for yr, filename in zip(years, filenames):
+        with open(filename) as f:
+            grid = decode_ersst(f.read(), bounding_box)
+
+        cube[len(times):len(times) + len(grid)] = grid
+        times += [(yr, month) for month in range(1, len(grid) + 1)]
+
+    # The current year may not have all 12 months yet
+    return cube[:len(times)], pd.DataFrame(times, columns=['year','month']), lats, lons
+
+
+def ersst_long_frame(cube, times, lats=ERSST_LATS, lons=ERSST_LONS):
+    # Long form view of a cube with one row per month and grid cell
+    n_times, n_lats, n_lons = cube.shape
+    return pd.DataFrame({
+        'year': np.repeat(times['year'].values, n_lats * n_lons),
+        'month': np.repeat(times['month'].values, n_lats * n_lons),
+        'lat': np.tile(np.repeat(lats, n_lons), n_times),
+        'lon': np.tile(lons, n_times * n_lats),
+        'temp': cube.reshape(-1)
+    })
+
+
+def ersst_frame(cube, times, lats=ERSST_LATS, lons=ERSST_LONS):
+    # Original load_ersst_data layout: one row per month and longitude with a column for each latitude
+    n_times, n_lats, n_lons = cube.shape
+    temps = pd.DataFrame(cube.transpose(0, 2, 1).reshape(-1, n_lats), columns=list(lats))
+    temps['year'] = np.repeat(times['year'].values, n_lons)
+    temps['month'] = np.repeat(times['month'].values, n_lons)
+    temps['lon'] = np.tile(lons, n_times)
+    return temps
+
+
+def load_ersst_data(year_start, year_end, bounding_box=None, use_cache=True, max_workers=8):
     # Download latest Extended Reconstructed Sea Surface Temperature (ERSST) data
-    base_url = 'https://www1.ncdc.noaa.gov/pub/data/cmb/ersst/v5/ascii/ersst.v5.{}.asc'
-    filedir = 'cache'
-    filename = '{}/ersst.p'.format(filedir)
-    
-    # Load from cache if file already exists
-    if os.path.isfile(filename) and use_cache:
-        print('Reading cached ERSST. Warning: Parameters ignored.')
-        with open(filename, 'rb') as f:
-            return pickle.load(f)
-    
-    print('Downloading ERSST data')
-    
-    temps = pd.DataFrame()
-    
-    # Each observation point is repeated 12 times - assuming full year file
-    months = [item for item in range(1,13) for _ in range(180)] 
-    
-    # Loop for each year
-    for yr in range(year_start, year_end+1):
-        print('Downloading year {}'.format(yr))
-        
-        with req.urlopen(base_url.format(yr)) as response:
-            content = response.read().decode('utf-8')
-            
-            # Split text file by newline delimiter and create columns by consecutive whitespaces
-            lines = content.split('\n')
-            new_data = pd.DataFrame([c.split() for c in lines if len(c.split())>0])
-            
-            # Convert columns to numeric remove -9999; Change temp to whole C degrees
-            for col in new_data.columns:
-                new_data[col] = pd.to_numeric(new_data[col]).replace(-9999, np.NaN) / 100.0
-
-            # Concatenate with previous year
-            new_data['year'] = yr
-            new_data['month'] = months
-            temps = pd.concat([temps, new_data], ignore_index=True, axis=0)
-
-    print('Processing ERSST data')      
-    # Define rows (longitude) and columns (latitude) 
-    # based on the specs https://www1.ncdc.noaa.gov/pub/data/cmb/ersst/v5/ascii/Readme
-    cols = [lat for lat in range(-88, 90, 2)] + ['year','month']
-    rows = [lon for lon in range(0, 360, 2)] * (year_end - year_start + 1) * 12
-    
-    temps.columns = cols
-    temps['lon'] = rows
-    
-    # Bounding box should be two tuples, top left and bottom right point. Note that latitude goes from -88 to +88
-    # as expected, but longitude increases from 0 to 358 EASTWARD. A range like 250-360 would roughly cover the Northern
-    # Atlantic
-    
+    key = cache_key(ERSST_URL, ERSST_SCHEMA_VERSION, year_start=year_start, year_end=year_end,
+                    bounding_box=bounding_box)
+
+    # The current year's file gains a month at a time and is fetched again on every call (see
+    # ersst_is_cached), so requests reaching it are always processed from the refreshed files
+    current = year_end >= pd.Timestamp.now().year
+
+    # Load from cache if the same request was already processed
+    if use_cache and not current:
+        temps = read_cache(key)
+        if temps is not None:
+            print('Reading cached ERSST')
+            return temps
+
+    cube, times, lats, lons = load_ersst_cube(year_start, year_end, bounding_box, max_workers=max_workers)
+
+    print('Processing ERSST data')
+    temps = ersst_frame(cube, times, lats, lons)
+
+    # Regional requests keep the original layout without the lon column
     if bounding_box is not None:
-        filter_lat = [c for c in range(-88, 90, 2) if (c<=bounding_box[0][0]) and (c>=bounding_box[1][0])] + ['year','month']
-        filter_lon = [c for c in range(0, 360, 2) if (c>=bounding_box[0][1]) and (c<=bounding_box[1][1])]
-    
-        temps = temps[temps['lon'].isin(filter_lon)][filter_lat]
-
-    # Cache the merged file 
-    if not os.path.exists(filedir):
-        os.makedirs(filedir)
-        
-    with open(filename, 'wb') as f:
-        pickle.dump(temps, f)
+        temps = temps.drop('lon', axis=1)
+
+    # Cache the merged file
+    if not current:
+        write_cache(key, temps)
 
     print('ERSST Complete')
     return temps
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# hurricane.py sits next to the notebook rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import pytest
+import hurricane
+from hurricane import download_ersst, download_ersst_year, ersst_filename, load_ersst_data
+
+
+def asc_file(year, months=12):
+    # A yearly file in the ERSST layout: per month 180 longitude lines of 89 latitude values in 0.01 C
+    rng = np.random.default_rng(year)
+    values = rng.integers(-200, 3200, size=(months, 180, 89))
+    values[rng.random(values.shape) < 0.3] = -9999
+    lines = [''.join('{:6d}'.format(v) for v in row) for month in values for row in month]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class ErsstHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        name = self.path.split('/')[-1]
+        self.server.requests.append(name)
+
+        if self.server.failures.get(name, 0) > 0:
+            self.server.failures[name] -= 1
+            self.send_error(503)
+            return
+        if name not in self.server.files:
+            self.send_error(404)
+            return
+
+        body = self.server.files[name]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ErsstHandler)
+    server.files = {}
+    server.failures = {}
+    server.requests = []
+    server.url = 'http://127.0.0.1:{}/ersst.v5.{{}}.asc'.format(server.server_port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Retries don't wait
+    sleeps = []
+    monkeypatch.setattr(hurricane.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def old_ersst_frame(server, year_start, year_end, bounding_box=None):
+    # The original load_ersst_data, parsing the fixture files served for the years
+    temps = pd.DataFrame()
+    months = [item for item in range(1,13) for _ in range(180)]
+    for yr in range(year_start, year_end+1):
+        content = server.files['ersst.v5.{}.asc'.format(yr)].decode('utf-8')
+        lines = content.split('\n')
+        new_data = pd.DataFrame([c.split() for c in lines if len(c.split())>0])
+        for col in new_data.columns:
+            new_data[col] = pd.to_numeric(new_data[col]).replace(-9999, np.nan) / 100.0
+        new_data['year'] = yr
+        new_data['month'] = months
+        temps = pd.concat([temps, new_data], ignore_index=True, axis=0)
+
+    cols = [lat for lat in range(-88, 90, 2)] + ['year','month']
+    rows = [lon for lon in range(0, 360, 2)] * (year_end - year_start + 1) * 12
+    temps.columns = cols
+    temps['lon'] = rows
+
+    if bounding_box is not None:
+        filter_lat = [c for c in range(-88, 90, 2) if (c<=bounding_box[0][0]) and (c>=bounding_box[1][0])] + ['year','month']
+        filter_lon = [c for c in range(0, 360, 2) if (c>=bounding_box[0][1]) and (c<=bounding_box[1][1])]
+        temps = temps[temps['lon'].isin(filter_lon)][filter_lat]
+    return temps
+
+
+def test_only_missing_years_are_fetched(server, tmp_path):
+    for yr in [2000, 2001, 2002]:
+        server.files['ersst.v5.{}.asc'.format(yr)] = asc_file(yr)
+    filedir = str(tmp_path)
+
+    download_ersst([2001], base_url=server.url, filedir=filedir)
+    server.requests.clear()
+
+    filenames = download_ersst([2000, 2001, 2002], base_url=server.url, filedir=filedir)
+    assert sorted(server.requests) == ['ersst.v5.2000.asc', 'ersst.v5.2002.asc']
+    assert filenames == [ersst_filename(yr, server.url, filedir) for yr in [2000, 2001, 2002]]
+    for yr, filename in zip([2000, 2001, 2002], filenames):
+        with open(filename, 'rb') as f:
+            assert f.read() == server.files['ersst.v5.{}.asc'.format(yr)]
+    assert not [name for name in tmp_path.iterdir() if name.suffix == '.tmp']
+
+
+def test_current_year_is_refreshed(server, tmp_path):
+    year = pd.Timestamp.now().year
+    name = 'ersst.v5.{}.asc'.format(year)
+    server.files[name] = asc_file(year, months=1)
+    download_ersst([year], base_url=server.url, filedir=str(tmp_path))
+
+    # A month is appended, and the local copy picks it up on the next call
+    server.files[name] = asc_file(year, months=2)
+    filename, = download_ersst([year], base_url=server.url, filedir=str(tmp_path))
+    assert server.requests == [name, name]
+    with open(filename, 'rb') as f:
+        assert f.read() == server.files[name]
+
+
+def test_transient_error_is_retried(server, tmp_path, sleeps):
+    server.files['ersst.v5.2000.asc'] = asc_file(2000)
+    server.failures['ersst.v5.2000.asc'] = 2
+
+    filename = download_ersst_year(2000, base_url=server.url, filedir=str(tmp_path), retries=3)
+    assert server.requests == ['ersst.v5.2000.asc'] * 3
+    assert len(sleeps) == 2
+    with open(filename, 'rb') as f:
+        assert f.read() == server.files['ersst.v5.2000.asc']
+
+
+def test_failed_download_leaves_no_file(server, tmp_path, sleeps):
+    with pytest.raises(OSError):
+        download_ersst_year(2000, base_url=server.url, filedir=str(tmp_path), retries=2)
+
+    assert server.requests == ['ersst.v5.2000.asc'] * 3
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('bounding_box', [None, ((60, 250), (0, 360))])
+def test_matches_original_layout(server, tmp_path, monkeypatch, bounding_box):
+    for yr in [2000, 2001]:
+        server.files['ersst.v5.{}.asc'.format(yr)] = asc_file(yr)
+
+    # Download from the local server into a cache under tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(hurricane, 'download_ersst', functools.partial(download_ersst, base_url=server.url,
+                                                                       filedir=str(tmp_path / 'ersst')))
+
+    temps = load_ersst_data(2000, 2001, bounding_box=bounding_box)
+    expected = old_ersst_frame(server, 2000, 2001, bounding_box)
+
+    assert list(temps.columns) == list(expected.columns)
+    assert len(temps) == len(expected)
+    lats = [c for c in expected.columns if c not in ('year','month','lon')]
+    assert np.allclose(temps[lats].values, expected[lats].values, equal_nan=True)
+    for col in ['year','month'] + (['lon'] if bounding_box is None else []):
+        assert (temps[col].values == expected[col].values).all()
+
+    # A warm call is served from the processed cache without downloading again
+    server.requests.clear()
+    cached = load_ersst_data(2000, 2001, bounding_box=bounding_box)
+    assert server.requests == []
+    assert np.allclose(cached[lats].values, temps[lats].values, equal_nan=True)
@@ -0,0 +1,70 @@
+# Runs several BigQuery queries at once through a client from bigquery.get_client.
+#
+# All queries are submitted up front so BigQuery works on them in parallel. Pending jobs are then polled
+# together, waiting a little longer after every round without progress (exponential backoff) instead of
+# checking each job once a second. Results are downloaded page by page as soon as a job completes.
+#
+# Only the client methods query, check_job and get_query_rows are used, so any object with the same
+# interface (e.g. a local fake for testing) works too.
+
+from time import sleep
+import pandas as pd
+
+PAGE_SIZE = 10000
+INITIAL_DELAY = 0.5
+MAX_DELAY = 30
+
+
+def iter_pages(client, job_id, row_count, page_size=PAGE_SIZE):
+    # Yield the rows of a completed job in pages of page_size
+    offset = 0
+    while offset < row_count:
+        rows = client.get_query_rows(job_id, offset=offset, limit=page_size)
+        if not rows:
+            break
+        yield rows
+        offset += len(rows)
+
+
+def run_queries(client, queries, page_size=PAGE_SIZE, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY,
+                wait=sleep):
+    # queries: dict of name -> SQL. Yields (name, rows) for every page of every job, in order of completion
+    pending = {}
+    for name, query in queries.items():
+        job_id, _results = client.query(query)
+        print('Submitted {NAME} as job {JOB}'.format(NAME=name, JOB=job_id))
+        pending[name] = job_id
+
+    delay = initial_delay
+    while pending:
+        finished = []
+        for name, job_id in pending.items():
+            complete, row_count = client.check_job(job_id)
+            if complete:
+                finished.append(name)
+                print('Job {JOB} complete - downloading {N} rows...'.format(JOB=job_id, N=row_count))
+                for rows in iter_pages(client, job_id, row_count, page_size):
+                    yield name, rows
+
+        for name in finished:
+            del pending[name]
+
+        if pending:
+            # Back off while nothing finishes, start over once a job completes
+            if finished:
+                delay = initial_delay
+            wait(delay)
+            delay = min(delay * 2, max_delay)
+
+
+def fetch_all(client, queries, **kwargs):
+    # Runs all queries and returns a dict of name -> list of rows
+    results = {name: [] for name in queries}
+    for name, rows in run_queries(client, queries, **kwargs):
+        results[name].extend(rows)
+    return results
+
+
+def fetch_frames(client, queries, **kwargs):
+    # Runs all queries and returns a dict of name -> DataFrame
+    return {name: pd.DataFrame.from_dict(rows) for name, rows in fetch_all(client, queries, **kwargs).items()}
@@ -0,0 +1,144 @@
+# Count-state Markov chain for plate appearances, built from the batting query results.
+#
+# The 12 counts from 0-0 to 3-2 are the transient states and walk, strikeout, hit and other (anything else
+# that ends the plate appearance) are absorbing. From every count a pitch is a hit, ball, strike, other or
+# a repeat of the same count. Repeats are two strike fouls, recorded as strikes, and are found by flow
+# conservation: every pitch at a two strike count that did not arrive there by a ball or a strike is one.
+# The query rows are split by hitterPitchCount, which is summed over.
+#
+# Everything is computed for many groups at once (e.g. pitchers or seasons) as stacked arrays of shape
+# (groups, 16, 16), so absorption probabilities for thousands of pitchers are a single batched solve.
+
+import numpy as np
+import pandas as pd
+
+BALLS = 4
+STRIKES = 3
+N_COUNTS = BALLS * STRIKES
+ABSORBING = ['walk','strikeout','hit','other']
+EVENTS = ['hit','ball','strike','other','repeat']
+
+WALK, STRIKEOUT, HIT, OTHER = range(N_COUNTS, N_COUNTS + len(ABSORBING))
+
+
+def count_index(balls, strikes):
+    return balls * STRIKES + strikes
+
+
+def event_counts(data, by=None):
+    # Number of pitches per group, count and event as an array of shape (groups, 12, 5) plus the group keys
+    data = data[(data['startingBalls'] < BALLS) & (data['startingStrikes'] < STRIKES)]
+    if by:
+        codes, keys = pd.MultiIndex.from_frame(data[list(by)]).factorize()
+    else:
+        codes, keys = np.zeros(len(data), dtype=np.int64), pd.Index(['all'])
+
+    balls = data['startingBalls'].values.astype(np.int64)
+    strikes = data['startingStrikes'].values.astype(np.int64)
+    idx = codes * N_COUNTS + count_index(balls, strikes)
+    size = len(keys) * N_COUNTS
+
+    def total(values):
+        return np.bincount(idx, weights=values, minlength=size).reshape(len(keys), N_COUNTS)
+
+    pitches = total(data['pitches'].values)
+    hits, balls_thrown, strikes_thrown = (total(data[c].values) for c in ['hits','balls','strikes'])
+    other = pitches - hits - balls_thrown - strikes_thrown
+
+    # Pitches seen again at the same count (two strike fouls) are the pitches at a two strike count minus
+    # the arrivals there: strikes thrown at one strike plus balls thrown at the two strike count before it
+    two_strikes = count_index(np.arange(BALLS), STRIKES - 1)
+    arrivals = strikes_thrown[:, two_strikes - 1].copy()
+    arrivals[:, 1:] += balls_thrown[:, two_strikes[:-1]]
+    repeat = np.zeros_like(pitches)
+    repeat[:, two_strikes] = np.maximum(pitches[:, two_strikes] - arrivals, 0)
+
+    # Repeats were recorded as strikes (or other), so move them out of those. A group can have more pitches
+    # at a count than arrivals, e.g. a reliever entering mid at-bat, so at most that many are repeats and
+    # every count's events still add up to its pitches
+    repeat = np.minimum(repeat, strikes_thrown + other)
+    from_strikes = np.minimum(repeat, strikes_thrown)
+    strikes_thrown = strikes_thrown - from_strikes
+    other = other - (repeat - from_strikes)
+
+    return np.stack([hits, balls_thrown, strikes_thrown, other, repeat], axis=-1), keys
+
+
+def event_rates(counts, prior=0):
+    # Event probabilities per group and count. Groups are shrunk towards the pooled rates by prior pitches,
+    # and counts a group never reached use the pooled rates. A count with nothing but repeats never leaves
+    # itself, so it counts as not reached
+    resolved = np.delete(counts, EVENTS.index('repeat'), axis=-1).sum(axis=-1, keepdims=True) > 0
+    counts = np.where(resolved, counts, 0)
+
+    pooled = counts.sum(axis=0)
+    pooled_total = pooled.sum(axis=-1, keepdims=True)
+    # Counts nobody reached end the plate appearance as other
+    only_other = np.eye(len(EVENTS))[EVENTS.index('other')]
+    pooled = np.where(pooled_total > 0, pooled / np.maximum(pooled_total, 1), only_other)
+
+    total = counts.sum(axis=-1, keepdims=True)
+    weight = total + prior
+    rates = (counts + prior * pooled) / np.maximum(weight, 1e-12)
+    return np.where(weight > 0, rates, pooled)
+
+
+def transition_matrices(rates):
+    # Stack of (16, 16) transition matrices from event rates of shape (groups, 12, 5)
+    n_groups = rates.shape[0]
+    P = np.zeros((n_groups, N_COUNTS + len(ABSORBING), N_COUNTS + len(ABSORBING)))
+
+    src = np.arange(N_COUNTS)
+    balls, strikes = np.divmod(src, STRIKES)
+    destinations = {
+        'hit': np.full(N_COUNTS, HIT),
+        'ball': np.where(balls < BALLS - 1, count_index(balls + 1, strikes), WALK),
+        'strike': np.where(strikes < STRIKES - 1, count_index(balls, strikes + 1), STRIKEOUT),
+        'other': np.full(N_COUNTS, OTHER),
+        'repeat': src
+    }
+    for i, event in enumerate(EVENTS):
+        P[:, src, destinations[event]] += rates[:, :, i]
+
+    absorbing = np.arange(N_COUNTS, N_COUNTS + len(ABSORBING))
+    P[:, absorbing, absorbing] = 1
+    return P
+
+
+def absorption(P):
+    # Probability of ending in each absorbing state from every count, shape (groups, 12, 4),
+    # and the expected number of pitches remaining from every count, shape (groups, 12)
+    Q = P[:, :N_COUNTS, :N_COUNTS]
+    R = P[:, :N_COUNTS, N_COUNTS:]
+    I_Q = np.eye(N_COUNTS) - Q
+
+    probabilities = np.linalg.solve(I_Q, R)
+    pitches = np.linalg.solve(I_Q, np.ones((len(P), N_COUNTS, 1)))[..., 0]
+    return probabilities, pitches
+
+
+def state_after(P, n, balls=0, strikes=0):
+    # Distribution over all 16 states after n pitches starting from the given count, shape (groups, 16)
+    return np.linalg.matrix_power(P, n)[:, count_index(balls, strikes), :]
+
+
+def outcome_table(data, by=None, prior=0):
+    # One row per group and count with the chance of each plate appearance result and the expected
+    # number of pitches still to come
+    counts, keys = event_counts(data, by)
+    probabilities, pitches = absorption(transition_matrices(event_rates(counts, prior)))
+
+    balls, strikes = np.divmod(np.arange(N_COUNTS), STRIKES)
+    d = pd.DataFrame({
+        'startingBalls': np.tile(balls, len(keys)),
+        'startingStrikes': np.tile(strikes, len(keys))
+    })
+    for i, name in enumerate(ABSORBING):
+        d[name] = probabilities[:, :, i].ravel()
+    d['expectedPitches'] = pitches.ravel()
+    d['pitches'] = counts.sum(axis=-1).ravel()
+
+    if by:
+        group_keys = keys.to_frame(index=False, name=list(by)).loc[np.repeat(np.arange(len(keys)), N_COUNTS)]
+        d = pd.concat([group_keys.reset_index(drop=True), d], axis=1)
+    return d
@@ -0,0 +1,51 @@
+# Data preparation for the pitch outcome by pitch type heatmap in mlb-bq-pitchdata.py.
+#
+# Accepts the aggregated query results (one row per pitcher, pitch type and outcome with a throws column)
+# or pitch-level rows without throws, where every row counts once. Input can also be an iterable of
+# DataFrames, e.g. pd.read_csv(..., chunksize=1000000), so whole seasons are summed chunk by chunk and only
+# the small outcome x pitch type table is ever held in memory.
+
+import numpy as np
+import pandas as pd
+
+TOP_OUTCOMES = 10
+EXCLUDED_PITCH_TYPES = ['Intentional Ball','Other','Pitchout']
+
+
+def count_outcomes_by_type(chunks):
+    # Sum of throws per outcome (rows) and pitch type (columns) over all chunks
+    totals = None
+    for chunk in chunks:
+        outcome = pd.Categorical(chunk['outcomeDescription'])
+        pitch = pd.Categorical(chunk['pitchTypeDescription'])
+
+        # Rows missing either value are left out, like a groupby would
+        valid = (outcome.codes >= 0) & (pitch.codes >= 0)
+        flat = outcome.codes[valid].astype(np.int64) * len(pitch.categories) + pitch.codes[valid]
+        weights = chunk['throws'].values[valid] if 'throws' in chunk else None
+
+        counts = np.bincount(flat, weights=weights, minlength=len(outcome.categories) * len(pitch.categories))
+        counts = pd.DataFrame(counts.reshape(len(outcome.categories), len(pitch.categories)),
+                              index=outcome.categories, columns=pitch.categories)
+        totals = counts if totals is None else totals.add(counts, fill_value=0)
+
+    return totals.fillna(0)
+
+
+def crossplot_data(data, top=TOP_OUTCOMES, excluded=EXCLUDED_PITCH_TYPES):
+    # Share of each outcome per pitch type. Outcomes outside the top by total throws are grouped into
+    # 'Other' and the excluded pitch types are dropped
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    counts = count_outcomes_by_type(chunks)
+
+    keep = counts.sum(axis=1).sort_values(kind='mergesort').index[-top:]
+    labels = np.where(counts.index.isin(keep), counts.index, 'Other')
+
+    counts = counts.loc[:, ~counts.columns.isin(excluded)]
+    counts = counts.groupby(labels).sum()
+    counts = counts[counts.sum(axis=1) > 0].sort_index().sort_index(axis=1)
+    counts.index.name = 'outcomeDescription'
+    counts.columns.name = 'pitchTypeDescription'
+
+    # Normalize each column (pitch type) to 100%
+    return counts / counts.sum()
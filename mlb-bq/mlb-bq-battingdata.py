@@ -4,23 +4,21 @@
 # In[1]:
 
 from bigquery import get_client
-from time import sleep
+from bq_runner import fetch_all
+from query_cache import QueryCache
+from count_states import outcome_table
 import pandas as pd
 import numpy as np
-import io, os, pickle
+import io
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 
 # In[4]:
 
-FILE_NAME = 'batter_data.p'
+CACHE = QueryCache()
 
-def get_bq_data():
-    # Download the .json key from your Google Cloud account
-    client = get_client(json_key_file='bq-query.json', readonly=True)
-    
-    query = """
+QUERY = """
     #standardSQL
     SELECT
       startingBalls,
@@ -46,34 +44,23 @@ def get_bq_data():
       startingBalls,
       startingStrikes,
       hitterPitchCount
-    """
+"""
 
-    job_id, _results = client.query(query)
-    complete = False
-
-    while not complete==True:
-        print('Checking for job {JOB}...'.format(JOB=job_id))
-        complete, row_count = client.check_job(job_id)
-        sleep(1)
+def get_bq_data(query):
+    # Download the .json key from your Google Cloud account
+    client = get_client(json_key_file='bq-query.json', readonly=True)
 
-    print('Job complete - downloading...')
-    results = client.get_query_rows(job_id)
+    results = fetch_all(client, {'batting': query})['batting']
     print('Downloaded {N} results...'.format(N=len(results)))
-    
-    with open(FILE_NAME, 'wb') as f:
-        pickle.dump(results, f)
-    return results
+    return pd.DataFrame.from_dict(results)
         
 def get_data():
-    if os.path.exists(FILE_NAME):
-        print('Reading downloaded file...')
-        with open(FILE_NAME, 'rb') as f:
-            d = pickle.load(f)
-        return pd.DataFrame.from_dict(d)
-    else:
+    # Cached per query text, so editing QUERY downloads fresh results
+    def download():
         print('Downloading from BQ...')
-        d = get_bq_data()
-        return pd.DataFrame.from_dict(d)
+        return get_bq_data(QUERY)
+
+    return CACHE.get_or_fetch(QUERY, download)
 
 results = get_data()
 results.head()
@@ -95,6 +82,14 @@ results_pct = calc_percentages(results)
 results_pct.head(10)
 
 
+# In[ ]:
+
+# Chance of a walk, strikeout, hit or other result from each count, through the count-state Markov chain.
+# Add grouping columns to the query and pass them as by= to compare pitchers or seasons
+results_outcomes = outcome_table(results)
+results_outcomes.head(12)
+
+
 # In[114]:
 
 def graph_data(data):
@@ -4,23 +4,20 @@
 # In[ ]:
 
 from bigquery import get_client
-from time import sleep
+from bq_runner import fetch_all
+from query_cache import QueryCache
+from crossplot import crossplot_data
 import pandas as pd
-import numpy as np
-import io, os, pickle
+import io
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 
 # In[ ]:
 
-FILE_NAME = 'pitcher_data.p'
+CACHE = QueryCache()
 
-def get_bq_data():
-    # Download the .json key from your Google Cloud account
-    client = get_client(json_key_file='bq-query.json', readonly=True)
-    
-    query = """
+QUERY = """
     SELECT
         pitcherId,
         pitchTypeDescription,
@@ -34,34 +31,23 @@ def get_bq_data():
         pitcherId,
         pitchTypeDescription,
         outcomeDescription
-    """
+"""
 
-    job_id, _results = client.query(query)
-    complete = False
-
-    while not complete==True:
-        print('Checking for job {JOB}...'.format(JOB=job_id))
-        complete, row_count = client.check_job(job_id)
-        sleep(1)
+def get_bq_data(query):
+    # Download the .json key from your Google Cloud account
+    client = get_client(json_key_file='bq-query.json', readonly=True)
 
-    print('Job complete - downloading...')
-    results = client.get_query_rows(job_id)
+    results = fetch_all(client, {'pitches': query})['pitches']
     print('Downloaded {N} results...'.format(N=len(results)))
-    
-    with open(FILE_NAME, 'wb') as f:
-        pickle.dump(results, f)
-    return results
+    return pd.DataFrame.from_dict(results)
         
 def get_data():
-    if os.path.exists(FILE_NAME):
-        print('Reading downloaded file...')
-        with open(FILE_NAME, 'rb') as f:
-            d = pickle.load(f)
-        return pd.DataFrame.from_dict(d)
-    else:
+    # Cached per query text, so editing QUERY downloads fresh results
+    def download():
         print('Downloading from BQ...')
-        d = get_bq_data()
-        return pd.DataFrame.from_dict(d)
+        return get_bq_data(QUERY)
+
+    return CACHE.get_or_fetch(QUERY, download)
 
 results = get_data()
 results.head()
@@ -71,23 +57,8 @@ results.head()
 
 def plot_top_crossplot(data):
     get_ipython().magic('matplotlib inline')
-    d = data.copy()
-    
-    # Group small outcomes into 'Other'
-    outcome_other = d.groupby('outcomeDescription').agg({'throws': np.sum}).reset_index().sort_values(by='throws').tail(10)['outcomeDescription'].values
-    d['outcomeDescription'] = d.apply(lambda x: 'Other' if x['outcomeDescription'] not in outcome_other 
-                                            else x['outcomeDescription'], axis=1)
-    
-    # Remove three pitch types with little data
-    d = d[~d['pitchTypeDescription'].isin(['Intentional Ball','Other','Pitchout'])]
-
-    # Create a pivot from the sums
-    d = d.groupby(['outcomeDescription','pitchTypeDescription']).agg({'throws': np.sum}).reset_index()
-    d = d.pivot(index='outcomeDescription',columns='pitchTypeDescription', values='throws').fillna(0)
-        
-    # Convert values to % of each column (pitch type)
-    data_sums = d.sum()
-    d = d.apply(lambda x: x/data_sums, axis=1)
+    # data can also be pitch-level rows or chunks of them, see crossplot.py
+    d = crossplot_data(data)
     
     # Create the plot
     plt.figure(figsize=(18,10))
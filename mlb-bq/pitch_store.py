@@ -0,0 +1,181 @@
+# Local pitch-level store for the games_wide table so aggregations run offline and in-process.
+#
+# Pitches are downloaded once and saved under STORE_DIR partitioned by year, one .npy file per column.
+# Text columns are dictionary encoded: the files hold integer codes and dictionaries.json holds the values,
+# shared by all partitions so codes mean the same thing everywhere. Counts are stored as small integers.
+#
+# group_count answers GROUP BY queries by combining the key codes into a single index and counting with
+# np.bincount, which handles millions of pitches in well under a second. pitch_outcomes and count_outcomes
+# return the same frames as the BigQuery aggregations in mlb-bq-pitchdata.py and mlb-bq-battingdata.py.
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from bq_runner import run_queries
+
+STORE_DIR = 'pitch_store'
+
+PITCH_QUERY = """
+    #standardSQL
+    SELECT
+      year,
+      pitcherId,
+      pitchTypeDescription,
+      outcomeDescription,
+      SUBSTR(outcomeId, 1, 1) outcomeClass,
+      startingBalls,
+      startingStrikes,
+      hitterPitchCount
+    FROM
+      `bigquery-public-data.baseball.games_wide`
+    WHERE
+      atBatEventType='PITCH' AND year={YEAR}
+"""
+
+# Column -> storage. 'dict' columns are dictionary encoded, the rest are stored with the given dtype
+COLUMNS = {
+    'pitcherId': 'dict',
+    'pitchTypeDescription': 'dict',
+    'outcomeDescription': 'dict',
+    'outcomeClass': 'dict',
+    'startingBalls': np.int8,
+    'startingStrikes': np.int8,
+    'hitterPitchCount': np.int16
+}
+
+
+class PitchStore:
+    def __init__(self, path=STORE_DIR):
+        self._path = path
+        self._dict_path = os.path.join(path, 'dictionaries.json')
+        self.dictionaries = {c: [] for c, kind in COLUMNS.items() if kind == 'dict'}
+
+        if os.path.isfile(self._dict_path):
+            with open(self._dict_path) as f:
+                self.dictionaries.update(json.load(f))
+
+    def years(self):
+        if not os.path.isdir(self._path):
+            return []
+        return sorted(int(d) for d in os.listdir(self._path) if d.isdigit())
+
+    def ingest(self, df, year):
+        # Save the pitches of one year, replacing that partition if it exists
+        tmp_path = os.path.join(self._path, '.tmp-{}'.format(year))
+        os.makedirs(tmp_path, exist_ok=True)
+
+        for col, kind in COLUMNS.items():
+            if kind == 'dict':
+                values = self._encode(col, df[col])
+            else:
+                values = df[col].fillna(-1).values.astype(kind)
+            np.save(os.path.join(tmp_path, '{}.npy'.format(col)), values)
+
+        # Dictionaries are written before the partition so its codes always resolve
+        with open(self._dict_path, 'w') as f:
+            json.dump(self.dictionaries, f)
+
+        path = os.path.join(self._path, str(year))
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+        print('Stored {N} pitches for {Y}'.format(N=len(df), Y=year))
+
+    def _encode(self, col, values):
+        # Extend the dictionary with unseen values and return int32 codes; missing values map to -1
+        dictionary = self.dictionaries[col]
+        uniques = pd.unique(values.dropna())
+        known = set(dictionary)
+        dictionary.extend(v for v in uniques if v not in known)
+        return pd.Categorical(values, categories=dictionary).codes.astype(np.int32)
+
+    def column(self, col, years=None):
+        # Raw stored values (codes for dictionary columns) across the selected years, memory mapped per year
+        parts = [np.load(os.path.join(self._path, str(y), '{}.npy'.format(col)), mmap_mode='r')
+                 for y in (years or self.years())]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def decode(self, col, codes):
+        if COLUMNS[col] != 'dict':
+            return codes
+        return pd.Categorical.from_codes(codes, categories=self.dictionaries[col]).astype(object)
+
+    def group_count(self, keys, years=None, sums=None):
+        # Count pitches per combination of keys, optionally also summing boolean masks given in sums
+        # (dict of name -> function of the store and years returning a mask). Returns one row per non-empty
+        # group; pitches with a missing key are left out
+        codes, dims = [], []
+        for key in keys:
+            values = self.column(key, years).astype(np.int64)
+            # Counts are non-negative so they act as their own codes
+            size = len(self.dictionaries[key]) if COLUMNS[key] == 'dict' else int(values.max(initial=-1)) + 1
+            # Missing values (-1) go to an extra last slot of each dimension and are dropped below
+            codes.append(np.where(values < 0, size, values))
+            dims.append(size + 1)
+
+        flat = np.ravel_multi_index(codes, dims)
+        size = int(np.prod(dims))
+
+        counts = np.bincount(flat, minlength=size)
+        totals = {name: np.bincount(flat, weights=mask(self, years), minlength=size)
+                  for name, mask in (sums or {}).items()}
+
+        cells = np.flatnonzero(counts)
+        valid = np.all([c < d - 1 for c, d in zip(np.unravel_index(cells, dims), dims)], axis=0)
+        cells = cells[valid]
+
+        result = {}
+        for key, c in zip(keys, np.unravel_index(cells, dims)):
+            result[key] = self.decode(key, c)
+        for name, total in totals.items():
+            result[name] = total[cells].astype(np.int64)
+        result['count'] = counts[cells]
+
+        return pd.DataFrame(result)
+
+    def outcome_mask(self, outcome_class, years=None):
+        # Pitches whose outcomeId starts with outcome_class ('a' hit, 'k' strike, 'b' ball)
+        classes = self.dictionaries['outcomeClass']
+        if outcome_class not in classes:
+            return np.zeros(len(self.column('outcomeClass', years)), dtype=bool)
+        return self.column('outcomeClass', years) == classes.index(outcome_class)
+
+
+def download(client, years, store=None):
+    # Pull the pitches for each year from BigQuery, all years running concurrently, and store them. The
+    # pages of a job arrive back to back, so a year is stored as soon as a page of another year (or the end)
+    # shows its job was downloaded, and at most one season plus a page is held in memory
+    store = store or PitchStore()
+    queries = {year: PITCH_QUERY.format(YEAR=int(year)) for year in years}
+
+    current, pages = None, []
+    for year, rows in run_queries(client, queries):
+        if year != current:
+            if pages:
+                store.ingest(pd.DataFrame.from_dict(pages), current)
+            current, pages = year, []
+        pages.extend(rows)
+
+    if pages:
+        store.ingest(pd.DataFrame.from_dict(pages), current)
+    return store
+
+
+def pitch_outcomes(store, years=None):
+    # Same frame as the mlb-bq-pitchdata.py query: throws per pitcher, pitch type and outcome
+    d = store.group_count(['pitcherId','pitchTypeDescription','outcomeDescription'], years)
+    return d.rename(columns={'count': 'throws'})
+
+
+def count_outcomes(store, years=None, by=()):
+    # Same frame as the mlb-bq-battingdata.py query: hits, strikes and balls per count and pitch of the at bat.
+    # by adds grouping columns, e.g. ['pitcherId'] for the per pitcher tables used by count_states.py
+    sums = {
+        'hits': lambda s, y: s.outcome_mask('a', y),
+        'strikes': lambda s, y: s.outcome_mask('k', y),
+        'balls': lambda s, y: s.outcome_mask('b', y)
+    }
+    d = store.group_count(list(by) + ['startingBalls','startingStrikes','hitterPitchCount'], years, sums)
+    return d.rename(columns={'count': 'pitches'})
@@ -0,0 +1,131 @@
+# Local cache for BigQuery results, keyed on the query itself.
+#
+# The key is a hash of the query text with whitespace normalized plus any parameters, so editing the SQL
+# misses the cache instead of returning stale results. Each result is a folder with one .npy file per
+# column (strings as integer codes) which loads as a copy-on-write memory map. Entries expire after ttl
+# seconds and the least recently used entries are evicted once the cache exceeds max_bytes. Hit, miss,
+# expiry and eviction counts are kept in metrics.json in the cache folder.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'bq_cache'
+TTL = 7 * 24 * 3600
+MAX_BYTES = 1024 ** 3
+
+
+class QueryCache:
+    def __init__(self, cache_dir=CACHE_DIR, ttl=TTL, max_bytes=MAX_BYTES):
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._metrics_path = os.path.join(cache_dir, 'metrics.json')
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.metrics = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        if os.path.isfile(self._metrics_path):
+            with open(self._metrics_path) as f:
+                self.metrics.update(json.load(f))
+
+    @staticmethod
+    def key(query, **params):
+        normalized = re.sub(r'\s+', ' ', query).strip()
+        payload = json.dumps({'query': normalized, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _record(self, metric):
+        self.metrics[metric] += 1
+        with open(self._metrics_path, 'w') as f:
+            json.dump(self.metrics, f)
+
+    def get(self, query, **params):
+        path = os.path.join(self._cache_dir, self.key(query, **params))
+        meta_path = os.path.join(path, 'meta.json')
+
+        if not os.path.isfile(meta_path):
+            self._record('misses')
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        if self._ttl is not None and time.time() - meta['created'] > self._ttl:
+            shutil.rmtree(path)
+            self._record('expired')
+            self._record('misses')
+            return None
+
+        columns = {}
+        for i, col in enumerate(meta['columns']):
+            values = np.load(os.path.join(path, '{}.npy'.format(i)), mmap_mode='c')
+            if 'categories' in col:
+                values = pd.Categorical.from_codes(values, categories=col['categories']).astype(object)
+            columns[col['name']] = values
+
+        # Access time drives the LRU eviction
+        os.utime(meta_path)
+        self._record('hits')
+        return pd.DataFrame(columns, copy=False)
+
+    def put(self, query, df, **params):
+        tmp_path = os.path.join(self._cache_dir, '.tmp-{}'.format(uuid.uuid4().hex))
+        os.makedirs(tmp_path)
+
+        meta = {'created': time.time(), 'query': query, 'params': params, 'columns': []}
+        for i, name in enumerate(df.columns):
+            values = df.iloc[:, i]
+            col = {'name': name}
+
+            if values.dtype == object:
+                codes, uniques = pd.factorize(values)
+                col['categories'] = list(uniques)
+                values = codes.astype(np.int32)
+            else:
+                values = values.values
+
+            np.save(os.path.join(tmp_path, '{}.npy'.format(i)), values)
+            meta['columns'].append(col)
+
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, default=str)
+
+        path = os.path.join(self._cache_dir, self.key(query, **params))
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+
+        self.evict()
+
+    def get_or_fetch(self, query, fetch, **params):
+        # Returns the cached result or calls fetch() for a DataFrame and caches it
+        df = self.get(query, **params)
+        if df is not None:
+            print('Reading cached query results...')
+            return df
+
+        df = fetch()
+        self.put(query, df, **params)
+        return df
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self._cache_dir):
+            meta_path = os.path.join(entry.path, 'meta.json')
+            if entry.is_dir() and os.path.isfile(meta_path):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((os.stat(meta_path).st_mtime, size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(path)
+            total -= size
+            self._record('evicted')
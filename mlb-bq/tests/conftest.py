@@ -0,0 +1,32 @@
+import os
+import sys
+
+# The modules sit next to the scripts rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeClient:
+    # Stand-in for a bigquery.get_client client. jobs maps a query to (polls, rows): the job completes on its
+    # polls-th check_job call. Every call is recorded
+    def __init__(self, jobs):
+        self._jobs = {}
+        self._queries = jobs
+        self.checks = []
+        self.pages = []
+
+    def query(self, query):
+        job_id = 'job_{}'.format(len(self._jobs))
+        polls, rows = self._queries[query]
+        self._jobs[job_id] = {'polls': polls, 'rows': rows, 'checked': 0}
+        return job_id, None
+
+    def check_job(self, job_id):
+        job = self._jobs[job_id]
+        job['checked'] += 1
+        self.checks.append(job_id)
+        complete = job['checked'] >= job['polls']
+        return complete, len(job['rows']) if complete else 0
+
+    def get_query_rows(self, job_id, offset=0, limit=None):
+        self.pages.append((job_id, offset, limit))
+        return self._jobs[job_id]['rows'][offset:offset + limit]
@@ -0,0 +1,38 @@
+from bq_runner import fetch_all, run_queries
+from conftest import FakeClient
+
+
+def rows(name, n):
+    return [{'query': name, 'row': i} for i in range(n)]
+
+
+def test_completion_order_and_pages():
+    client = FakeClient({'slow': (3, rows('slow', 5)), 'fast': (1, rows('fast', 25)), 'empty': (2, [])})
+    waits = []
+
+    pages = list(run_queries(client, {'slow': 'slow', 'fast': 'fast', 'empty': 'empty'}, page_size=10,
+                             wait=waits.append))
+
+    # Jobs are downloaded as they complete, each in pages of page_size
+    assert [(name, len(page)) for name, page in pages] == [('fast', 10), ('fast', 10), ('fast', 5), ('slow', 5)]
+    assert client.pages == [('job_1', 0, 10), ('job_1', 10, 10), ('job_1', 20, 10), ('job_0', 0, 10)]
+    assert [r['row'] for name, page in pages if name == 'fast' for r in page] == list(range(25))
+
+
+def test_backoff():
+    client = FakeClient({'a': (2, rows('a', 1)), 'b': (8, rows('b', 1))})
+    waits = []
+
+    list(run_queries(client, {'a': 'a', 'b': 'b'}, initial_delay=0.5, max_delay=2, wait=waits.append))
+
+    # Doubling while nothing finishes, back to initial_delay after a completes, capped at max_delay and no
+    # wait once everything is done
+    assert waits == [0.5, 0.5, 1, 2, 2, 2, 2]
+    assert client.checks.count('job_1') == 8
+
+
+def test_fetch_all():
+    client = FakeClient({'a': (1, rows('a', 3)), 'b': (2, rows('b', 12))})
+    results = fetch_all(client, {'a': 'a', 'b': 'b'}, page_size=5, wait=lambda delay: None)
+
+    assert results == {'a': rows('a', 3), 'b': rows('b', 12)}
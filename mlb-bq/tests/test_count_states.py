@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from count_states import ABSORBING, EVENTS, event_counts, event_rates, outcome_table
+
+COLUMNS = ['pitcherId','startingBalls','startingStrikes','hitterPitchCount','hits','strikes','balls','pitches']
+
+
+def starter():
+    # Every plate appearance starts at 0-0: 0-0 to 0-1 to 0-2, a foul at 0-2, then a strikeout, and
+    # 0-0 to 1-0 to a hit
+    rows = [
+        (0, 0, 1, 0, 1, 1, 2),
+        (0, 1, 2, 0, 1, 0, 1),
+        (0, 2, 3, 0, 2, 0, 2),
+        (1, 0, 2, 1, 0, 0, 1),
+    ]
+    return [('starter',) + row for row in rows]
+
+
+def reliever():
+    # Enters at 0-2 mid at-bat: a ball, a foul, then a strikeout (at 1-2, recorded with the 0-2 row here).
+    # No pitch of theirs arrives at 0-2
+    return [('reliever', 0, 2, 3, 0, 2, 1, 3)]
+
+
+def closer():
+    # Enters at 0-2: a foul, then a strikeout. Every pitch looks like a repeat
+    return [('closer', 0, 2, 3, 0, 2, 0, 2)]
+
+
+def test_events_add_up_to_pitches():
+    data = pd.DataFrame(starter() + reliever(), columns=COLUMNS)
+    counts, keys = event_counts(data, by=['pitcherId'])
+
+    pitches = data.groupby(['pitcherId','startingBalls','startingStrikes'])['pitches'].sum()
+    totals = counts.sum(axis=-1)
+    for (pitcher, balls, strikes), n in pitches.items():
+        assert totals[keys.get_loc((pitcher,)), balls * 3 + strikes] == n
+
+    # The starter's foul at 0-2 is a repeat, the reliever's ball can't be
+    repeat = EVENTS.index('repeat')
+    assert counts[keys.get_loc(('starter',)), 2, repeat] == 1
+    assert counts[keys.get_loc(('reliever',)), 2, repeat] == 2
+
+
+def test_mid_at_bat_group():
+    data = pd.DataFrame(starter() + reliever() + closer(), columns=COLUMNS)
+    d = outcome_table(data, by=['pitcherId'])
+
+    assert np.isfinite(d[ABSORBING + ['expectedPitches']].values).all()
+    assert np.allclose(d[ABSORBING].sum(axis=1), 1)
+    assert d.loc[d['pitcherId'] == 'reliever', 'pitches'].sum() == 3
+
+
+def test_only_repeats_uses_pooled_rates():
+    counts = np.zeros((2, 12, len(EVENTS)))
+    counts[0, 2] = [1, 0, 1, 0, 1]
+    counts[1, 2, EVENTS.index('repeat')] = 2
+
+    rates = event_rates(counts)
+    assert np.allclose(rates[1, 2], rates[0, 2])
+    assert rates[:, :, EVENTS.index('repeat')].max() < 1
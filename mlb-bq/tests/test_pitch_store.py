@@ -0,0 +1,43 @@
+from conftest import FakeClient
+from pitch_store import PITCH_QUERY, PitchStore, download, pitch_outcomes
+
+
+def pitches(year, n):
+    return [{
+        'year': year,
+        'pitcherId': 'p{}'.format(i % 3),
+        'pitchTypeDescription': ['Fastball', 'Slider'][i % 2],
+        'outcomeDescription': ['Ball', 'Called Strike', 'Single'][i % 3],
+        'outcomeClass': ['b', 'k', 'a'][i % 3],
+        'startingBalls': i % 4,
+        'startingStrikes': i % 3,
+        'hitterPitchCount': i % 6
+    } for i in range(n)]
+
+
+class RecordingStore(PitchStore):
+    def __init__(self, path, client):
+        super().__init__(path)
+        self._client = client
+        self.ingested = []
+
+    def ingest(self, df, year):
+        # Pages downloaded so far when the year is stored
+        self.ingested.append((year, len(df), len(self._client.pages)))
+        super().ingest(df, year)
+
+
+def test_years_are_stored_as_their_jobs_complete(tmp_path):
+    client = FakeClient({
+        PITCH_QUERY.format(YEAR=2015): (1, pitches(2015, 25000)),
+        PITCH_QUERY.format(YEAR=2016): (3, pitches(2016, 20001))
+    })
+    store = RecordingStore(str(tmp_path / 'store'), client)
+
+    download(client, [2015, 2016], store)
+
+    # Each year takes 3 pages. 2015 is stored once the first page of 2016 arrives, before the rest of 2016
+    # is downloaded
+    assert store.ingested == [(2015, 25000, 4), (2016, 20001, 6)]
+    assert store.years() == [2015, 2016]
+    assert pitch_outcomes(store, [2015])['throws'].sum() == 25000
@@ -0,0 +1,93 @@
+# Aggregations of blocked connection attempts on the integer columns written by router_logs.py.
+#
+# IPs stay uint32 throughout, so /24 prefixes are a bit mask and only the distinct values are ever turned
+# into strings. Which source IPs tried which destination ports is held as a sparse IP x port incidence
+# matrix A. The number of IPs trying both of two ports is then the port x port product A.T @ A, which grows
+# with the number of distinct ports rather than the square of the attempts per IP, and the networkx graph
+# edges come straight from the non-zero entries of the matrices.
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from router_logs import format_ip
+
+PREFIX_MASK = np.uint32(0xFFFFFF00)
+
+
+def format_unique(values, formatter):
+    # Formats only the distinct values and maps them back to every row
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return formatter(uniques)[inverse]
+
+
+def format_prefix(ips):
+    # /24 prefix of each uint32 IP as the first three octets, e.g. '185.100.87'
+    def first3(prefixes):
+        octets = [pd.Series((prefixes >> shift) & 255).astype(str) for shift in (24, 16, 8)]
+        return (octets[0] + '.' + octets[1] + '.' + octets[2]).values
+    return format_unique(np.asarray(ips, dtype=np.uint32) & PREFIX_MASK, first3)
+
+
+def incidence(data, source='SourceIp', target='DestPort'):
+    # Sparse matrix of attempt counts with one row per distinct source and one column per distinct target,
+    # plus the row and column labels (sorted)
+    rows, row_codes = np.unique(data[source].values, return_inverse=True)
+    cols, col_codes = np.unique(data[target].values, return_inverse=True)
+    counts = sparse.coo_matrix((np.ones(len(data), dtype=np.int64), (row_codes, col_codes)),
+                               shape=(len(rows), len(cols))).tocsr()
+    counts.sum_duplicates()
+    return counts, rows, cols
+
+
+def top_ports(data, n):
+    # The n destination ports with the most attempts, in port order
+    ports, counts = np.unique(data['DestPort'].values, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    return np.sort(ports[order[:n]])
+
+
+def port_cooccurrence(data, n):
+    # Number of distinct source IPs that tried both ports, for every pair of the top n ports
+    ports = top_ports(data, n)
+    counts, _, cols = incidence(data[data['DestPort'].isin(ports)])
+
+    # Binary incidence: an IP counts once per port however often it tried it
+    tried = counts.astype(bool).astype(np.int64)
+    pairs = (tried.T @ tried).toarray()
+    return pd.DataFrame(pairs, index=pd.Index(cols, name='DestPort_x'), columns=pd.Index(cols, name='DestPort_y'))
+
+
+def main_ports(counts, cols, top):
+    # Destination port each source tried most (lowest port on ties), as a string if it is one of the top
+    # ports and 'Other' otherwise
+    main = cols[np.asarray(counts.argmax(axis=1)).ravel()]
+    return np.where(np.isin(main, top), main.astype(str), 'Other')
+
+
+def access_graph(data, top_n=10):
+    # Directed graph from source IPs to the ports they tried, weighted by attempts. IP nodes carry their
+    # main port (mport), ports are marked as such, as in the Gephi export
+    counts, ips, ports = incidence(data)
+    ip_names = format_ip(ips)
+
+    coo = counts.tocoo()
+    G = nx.DiGraph()
+    G.add_weighted_edges_from(zip(ip_names[coo.row], ports[coo.col].tolist(), coo.data.tolist()))
+
+    mport = main_ports(counts, ports, top_ports(data, top_n))
+    G.add_nodes_from((ip, {'ntype': 'ip', 'mport': m}) for ip, m in zip(ip_names, mport))
+    G.add_nodes_from(ports.tolist(), ntype='port', mport='Port')
+    return G
+
+
+def cooccurrence_graph(pairs):
+    # Undirected graph between ports weighted by the number of IPs trying both, without self loops
+    values = pairs.values.copy()
+    np.fill_diagonal(values, 0)
+    coo = sparse.coo_matrix(np.triu(values))
+
+    G = nx.Graph()
+    G.add_weighted_edges_from(zip(pairs.index.values[coo.row].tolist(), pairs.columns.values[coo.col].tolist(),
+                                  coo.data.tolist()))
+    return G
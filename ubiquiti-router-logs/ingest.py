@@ -0,0 +1,179 @@
+# Incremental ingest of the router logs into a partitioned parquet store.
+#
+# Every run only parses what was appended since the last one. The state file records per log file its inode,
+# size, the number of (uncompressed) bytes already parsed and the year and month of the last parsed line.
+# Files are recognized by a hash of their first line rather than by name, so an entry follows its file
+# through rotation (messages -> messages.1 -> messages.2.gz) and a file truncated or replaced in place
+# starts again from the beginning. Files whose inode and size haven't changed are not even opened.
+#
+# The year of a new file is taken from its modification time and the year of a continued file from the
+# state, rolling over whenever the month goes down (see router_logs.add_dates).
+#
+# Rows are appended to STORE_DIR as one new parquet file per month partition and run, which pd.read_parquet
+# reads back as a single frame. The state is saved after each file's rows are written.
+
+import fnmatch
+import hashlib
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from router_logs import BLOCK_SIZE, SCHEMA, add_dates, iter_blocks, open_log, parse_blocks
+
+STORE_DIR = 'log_store'
+STATE_FILE = 'ingest_state.json'
+LOG_PATTERN = 'messages*'
+
+
+class LocalSource:
+    # Log files in a local directory, a stand-in for the router
+    def __init__(self, directory):
+        self._directory = directory
+
+    def files(self, pattern=LOG_PATTERN):
+        # (name, inode, size, mtime) of every matching file
+        files = []
+        for name in sorted(fnmatch.filter(os.listdir(self._directory), pattern)):
+            st = os.stat(os.path.join(self._directory, name))
+            files.append((name, st.st_ino, st.st_size, st.st_mtime))
+        return files
+
+    def open(self, name):
+        return open(os.path.join(self._directory, name), 'rb')
+
+
+class SftpSource:
+    # Log files on the router, listed with stat over SSH (SFTP doesn't report inodes) and read over SFTP
+    def __init__(self, client, directory='/var/log'):
+        self._client = client
+        self._directory = directory
+        self._sftp = client.open_sftp()
+
+    def files(self, pattern=LOG_PATTERN):
+        command = "stat -c '%i %s %Y %n' {path}/{pattern}".format(path=self._directory, pattern=pattern)
+        stdin, stdout, stderr = self._client.exec_command(command)
+
+        files = []
+        for line in stdout.read().decode().splitlines():
+            inode, size, mtime, path = line.split(' ', 3)
+            files.append((os.path.basename(path), int(inode), int(size), float(mtime)))
+        return files
+
+    def open(self, name):
+        f = self._sftp.open('{}/{}'.format(self._directory, name), 'rb')
+        f.prefetch()
+        return f
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def first_line_key(f):
+    # Hash of the first line, or None while the file doesn't have a complete line yet
+    line = f.readline()
+    f.seek(0)
+    return hashlib.sha1(line).hexdigest() if line.endswith(b'\n') else None
+
+
+def append_store(d, store_dir=STORE_DIR):
+    # Appends d as one new file per month partition
+    run = uuid.uuid4().hex
+    months = d['Date'].values.astype('datetime64[M]')
+    for month in pd.unique(months):
+        path = os.path.join(store_dir, 'month={}'.format(month))
+        os.makedirs(path, exist_ok=True)
+
+        table = pa.Table.from_pandas(d[months == month], schema=SCHEMA, preserve_index=False)
+        pq.write_table(table, os.path.join(path, 'part-{}.parquet'.format(run)))
+
+
+def read_store(store_dir=STORE_DIR):
+    d = pd.read_parquet(store_dir).drop('month', axis=1)
+    return d.sort_values('Date', kind='mergesort').reset_index(drop=True)
+
+
+def read_new_lines(f, entry, mtime, pool, workers, block_size):
+    # Parses the complete lines after the entry's offset. Returns the dated rows and updates the entry
+    f.seek(entry['offset'])
+
+    sizes = []
+    def blocks():
+        for block in iter_blocks(f, block_size, partial=False):
+            sizes.append(len(block))
+            yield block
+
+    frames = list(parse_blocks(pool, blocks(), workers))
+    entry['offset'] += sum(sizes)
+
+    d = pd.concat(frames, ignore_index=True) if frames else None
+    if d is None or not len(d):
+        return None
+
+    if entry['year'] is None:
+        # New file: its last line was written by mtime, so count back the rollovers from there
+        months = d['Month'].values
+        modified = datetime.fromtimestamp(mtime)
+        last_year = modified.year - (1 if months[-1] + 1 > modified.month else 0)
+        d, last = add_dates(d, last_year - int((np.diff(months) < 0).sum()))
+    else:
+        d, last = add_dates(d, entry['year'], entry['month'])
+
+    entry['year'], entry['month'] = last
+    return d
+
+
+def ingest(source, store_dir=STORE_DIR, state_path=STATE_FILE, workers=None, block_size=BLOCK_SIZE):
+    # Appends the lines added to the source's log files since the last run to the store. Returns the
+    # number of new rows
+    state = load_state(state_path)
+    by_inode = {entry['inode']: key for key, entry in state.items()}
+    workers = workers or os.cpu_count()
+    current = set()
+    rows = 0
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Oldest first, so rows are appended in time order
+        for name, inode, size, mtime in sorted(source.files(), key=lambda file: file[3]):
+            key = by_inode.get(inode)
+            if key is not None and state[key]['size'] == size:
+                current.add(key)
+                continue
+
+            raw = source.open(name)
+            with raw, open_log(raw) as f:
+                key = first_line_key(f)
+                if key is None:
+                    continue
+
+                entry = state.get(key, {'offset': 0, 'year': None, 'month': None})
+                d = read_new_lines(f, entry, mtime, pool, workers, block_size)
+
+            if d is not None:
+                append_store(d, store_dir)
+                rows += len(d)
+
+            entry.update(name=name, inode=inode, size=size)
+            state[key] = entry
+            current.add(key)
+            save_state(state, state_path)
+            print('Processed {FILE}: {N} new rows'.format(FILE=name, N=0 if d is None else len(d)))
+
+    # Forget files that are gone
+    save_state({key: entry for key, entry in state.items() if key in current}, state_path)
+    return rows
@@ -0,0 +1,189 @@
+# Streaming parser for EdgeOS firewall log lines such as
+#
+#   Jan  1 00:00:01 ubnt kernel: [WAN_LOCAL-default-D]IN=eth0 OUT= MAC=... SRC=1.2.3.4 DST=5.6.7.8 LEN=40 ...
+#       PROTO=TCP SPT=44430 DPT=23 WINDOW=1024 RES=0x00 SYN URGP=0
+#
+# Files are read in blocks of whole lines, plain or gzip compressed (rotated messages.N.gz files), and the
+# blocks are parsed in a process pool with a single regex that captures every field at once. Parsed blocks
+# are appended to a parquet file as they complete, so memory use stays constant however many logs there are.
+# Syslog dates have no year, which add_dates infers from where the months roll over.
+#
+# Output columns are Date, Rule, SourceIp, DestIp, Proto, SourcePort and DestPort as in the original CSV, but
+# typed: IPs are uint32 (see format_ip / parse_ip), ports uint16 and dates datetime64.
+
+import gzip
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BLOCK_SIZE = 8 * 1024 ** 2
+
+MONTHS = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
+
+IP = r'(?P<{0}_a>\d+)\.(?P<{0}_b>\d+)\.(?P<{0}_c>\d+)\.(?P<{0}_d>\d+)'
+
+# Fields appear in this order in every iptables log line. [^\n] keeps a match within a single line
+LOG_LINE = re.compile(
+    r'^(?P<month>[A-Z][a-z]{2}) (?P<day>[ \d]\d) (?P<hour>\d\d):(?P<minute>\d\d):(?P<second>\d\d)'
+    r'[^\n]*?\[(?P<rule>[A-Za-z0-9\-_]*)\]'
+    r'[^\n]*?SRC=' + IP.format('src') + ' DST=' + IP.format('dst') +
+    r'[^\n]*?PROTO=(?P<proto>[A-Z]+)'
+    r'[^\n]*?SPT=(?P<src_port>\d+) DPT=(?P<dst_port>\d+)',
+    re.MULTILINE)
+
+GROUPS = {name: i for i, name in enumerate(LOG_LINE.groupindex)}
+
+SCHEMA = pa.schema([
+    ('Date', pa.timestamp('s')),
+    ('Rule', pa.string()),
+    ('SourceIp', pa.uint32()),
+    ('DestIp', pa.uint32()),
+    ('Proto', pa.string()),
+    ('SourcePort', pa.uint16()),
+    ('DestPort', pa.uint16())
+])
+
+
+def parse_ip(ips):
+    # Dotted quad strings to uint32
+    octets = pd.Series(ips).str.split('.', expand=True).values.astype(np.uint32)
+    return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+
+
+def format_ip(ips):
+    # uint32 to dotted quad strings
+    ips = np.asarray(ips, dtype=np.uint32)
+    octets = [pd.Series((ips >> shift) & 255).astype(str) for shift in (24, 16, 8, 0)]
+    return (octets[0] + '.' + octets[1] + '.' + octets[2] + '.' + octets[3]).values
+
+
+def parse_text(text):
+    # Parses every firewall line in text into a DataFrame with the output columns, except that the date is
+    # still split into Month (0-11), Day and Seconds of the day for add_dates. Other lines are skipped
+    fields = np.array(LOG_LINE.findall(text), dtype=str).reshape(-1, len(GROUPS))
+
+    # Month names that aren't real months can't be dated
+    month = pd.Index(MONTHS).get_indexer(fields[:, GROUPS['month']])
+    fields, month = fields[month >= 0], month[month >= 0]
+
+    def column(name, dtype=np.int64):
+        return fields[:, GROUPS[name]].astype(dtype)
+
+    def ip(prefix):
+        return ((column(prefix + '_a', np.uint32) << 24) | (column(prefix + '_b', np.uint32) << 16) |
+                (column(prefix + '_c', np.uint32) << 8) | column(prefix + '_d', np.uint32))
+
+    return pd.DataFrame({
+        'Month': month,
+        'Day': column('day'),
+        'Seconds': column('hour') * 3600 + column('minute') * 60 + column('second'),
+        'Rule': column('rule', object),
+        'SourceIp': ip('src'),
+        'DestIp': ip('dst'),
+        'Proto': column('proto', object),
+        'SourcePort': column('src_port', np.uint16),
+        'DestPort': column('dst_port', np.uint16)
+    })
+
+
+def parse_block(block):
+    return parse_text(block.decode('utf-8', errors='replace'))
+
+
+def add_dates(d, year, month=None):
+    # Syslog dates have no year. Lines are in time order, so the year goes up whenever the month goes down.
+    # year is the year of the first line, or with month given, of the line just before d, in that month.
+    # Returns the frame with a Date column and the (year, month) of its last line to continue from
+    months = d['Month'].values
+    previous = np.r_[months[:1] if month is None else [month], months[:-1]]
+    years = year + np.cumsum(months < previous)
+
+    date = ((years - 1970) * 12 + months).astype('datetime64[M]').astype('datetime64[D]') + (d['Day'].values - 1)
+    date = date.astype('datetime64[s]') + d['Seconds'].values
+
+    last = (int(years[-1]), int(months[-1])) if len(d) else (year, month)
+    d = d.drop(['Month','Day','Seconds'], axis=1)
+    d.insert(0, 'Date', date)
+    return d, last
+
+
+def open_log(source):
+    # source is a path or a seekable binary file object (e.g. from SFTP). Gzip is detected from the magic
+    # bytes, so rotated files are read compressed whatever their name
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            magic = f.read(2)
+        return gzip.open(source) if magic == b'\x1f\x8b' else open(source, 'rb')
+
+    magic = source.read(2)
+    source.seek(0)
+    return gzip.GzipFile(fileobj=source) if magic == b'\x1f\x8b' else source
+
+
+def iter_blocks(f, block_size=BLOCK_SIZE, partial=True):
+    # Yields blocks of complete lines from a binary file object. A last line without a newline is yielded
+    # too unless partial is False, e.g. when the file is still being written
+    rest = b''
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            rest = data
+            continue
+        yield data[:end]
+        rest = data[end:]
+    if rest and partial:
+        yield rest
+
+
+def parse_blocks(pool, blocks, workers):
+    # Parses blocks in the pool with a few per worker in flight and yields the frames in order
+    pending = deque()
+    for block in blocks:
+        pending.append(pool.submit(parse_block, block))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_frame(writer, d):
+    table = pa.Table.from_pandas(d, schema=SCHEMA, preserve_index=False)
+    writer.write_table(table)
+    return table.num_rows
+
+
+def parse_logs(sources, path, year=None, workers=None, block_size=BLOCK_SIZE):
+    # Parses all sources into the parquet file at path. Sources are paths or (name, file object) pairs, e.g.
+    # files opened over SFTP. year (default: the current one) is the year of the first line of each source.
+    # Returns the number of lines written
+    year = year or datetime.now().year
+    workers = workers or os.cpu_count()
+    rows = 0
+
+    with ProcessPoolExecutor(workers) as pool, pq.ParquetWriter(path, SCHEMA) as writer:
+        for source in sources:
+            name, source = source if isinstance(source, tuple) else (source, source)
+            last = (year, None)
+            with open_log(source) as f:
+                for d in parse_blocks(pool, iter_blocks(f, block_size), workers):
+                    d, last = add_dates(d, *last)
+                    rows += write_frame(writer, d)
+            print('Processed {FILE}'.format(FILE=name))
+
+    print('Combined {N} log files into {F}'.format(N=len(sources), F=path))
+    return rows
+
+
+def read_logs(path):
+    return pd.read_parquet(path)
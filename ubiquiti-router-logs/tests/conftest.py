@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules sit next to the notebook rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
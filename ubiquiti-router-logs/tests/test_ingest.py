@@ -0,0 +1,113 @@
+import gzip
+import os
+import shutil
+from datetime import datetime
+import pytest
+from ingest import LocalSource, ingest, read_store
+
+MONTHS = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
+
+
+def line(month, day, port):
+    # A firewall line identified by its source port
+    return ('{} {:2d} 12:00:00 ubnt kernel: [WAN_LOCAL-default-D]IN=eth0 OUT= MAC=00:11 SRC=185.100.87.1 '
+            'DST=72.84.10.3 LEN=40 PROTO=TCP SPT={} DPT=23 WINDOW=1024 RES=0x00 SYN URGP=0\n'
+            .format(MONTHS[month - 1], day, port))
+
+
+def lines(month, ports):
+    return ''.join(line(month, 1 + i % 28, port) for i, port in enumerate(ports))
+
+
+@pytest.fixture
+def logs(tmp_path):
+    directory = tmp_path / 'logs'
+    directory.mkdir()
+
+    def write(name, text, modified, mode='w'):
+        path = directory / name
+        with open(path, mode) as f:
+            f.write(text)
+        os.utime(path, (modified.timestamp(), modified.timestamp()))
+
+    def run():
+        return ingest(LocalSource(str(directory)), str(tmp_path / 'store'), str(tmp_path / 'state.json'), workers=1)
+
+    def store():
+        return read_store(str(tmp_path / 'store'))
+
+    return directory, write, run, store
+
+
+def test_rotation_continues_from_offset(logs):
+    directory, write, run, store = logs
+
+    write('messages', lines(3, range(1000, 1010)), datetime(2017, 3, 20))
+    assert run() == 10
+
+    # Lines added before rotation are picked up from messages.1, then the new messages is read in full
+    write('messages', lines(3, range(1010, 1015)), datetime(2017, 3, 29), mode='a')
+    os.rename(directory / 'messages', directory / 'messages.1')
+    write('messages', lines(4, range(1015, 1020)), datetime(2017, 4, 10))
+    assert run() == 10
+
+    # messages.1 is compressed to messages.2.gz and only the new messages is read
+    with open(directory / 'messages.1', 'rb') as f, gzip.open(directory / 'messages.2.gz', 'wb') as gz:
+        shutil.copyfileobj(f, gz)
+    os.utime(directory / 'messages.2.gz', (datetime(2017, 3, 29).timestamp(),) * 2)
+    os.remove(directory / 'messages.1')
+    os.rename(directory / 'messages', directory / 'messages.1')
+    write('messages', lines(4, range(1020, 1025)), datetime(2017, 4, 20))
+    assert run() == 5
+    assert run() == 0
+
+    d = store()
+    assert sorted(d['SourcePort']) == list(range(1000, 1025))
+    assert (d['Date'].dt.year == 2017).all()
+
+
+def test_partial_line_not_consumed(logs):
+    directory, write, run, store = logs
+
+    complete = lines(5, range(2000, 2003))
+    last = line(5, 10, 2003)
+    write('messages', complete + last[:40], datetime(2017, 5, 20))
+    assert run() == 3
+
+    write('messages', last[40:] + line(5, 11, 2004), datetime(2017, 5, 21), mode='a')
+    assert run() == 2
+
+    assert sorted(store()['SourcePort']) == list(range(2000, 2005))
+
+
+def test_year_rollover(logs):
+    directory, write, run, store = logs
+
+    write('messages', lines(12, range(3000, 3005)), datetime(2016, 12, 29))
+    assert run() == 5
+
+    write('messages', lines(1, range(3005, 3010)), datetime(2017, 1, 10), mode='a')
+    assert run() == 5
+
+    d = store().set_index('SourcePort')['Date']
+    assert (d.loc[3000:3004].dt.year == 2016).all()
+    assert (d.loc[3005:3009].dt.year == 2017).all()
+    assert (d.loc[3005:3009].dt.month == 1).all()
+
+
+def test_new_file_dated_from_mtime(logs):
+    directory, write, run, store = logs
+
+    # Last written in January 2018, so the November and December lines are from 2017
+    text = lines(11, range(4000, 4003)) + lines(12, range(4003, 4006)) + lines(1, range(4006, 4009))
+    write('messages', text, datetime(2018, 1, 15))
+    assert run() == 9
+
+    d = store().set_index('SourcePort')['Date']
+    assert (d.loc[4000:4005].dt.year == 2017).all()
+    assert (d.loc[4006:4008].dt.year == 2018).all()
+
+    # A file whose last line is from an earlier month than its mtime stays in the mtime's year
+    write('messages.1', lines(6, range(4100, 4103)), datetime(2015, 8, 1))
+    assert run() == 3
+    assert (store().set_index('SourcePort')['Date'].loc[4100:4102].dt.year == 2015).all()
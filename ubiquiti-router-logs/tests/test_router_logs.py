@@ -0,0 +1,60 @@
+import datetime
+import gzip
+import os
+import re
+import pandas as pd
+from conftest import FIXTURES
+from router_logs import format_ip, parse_logs, read_logs
+
+# The per-line parser router_logs.py replaced, as it was in the notebook
+rules = {
+    'rule': re.compile(r"\[([A-Za-z0-9\-\_]*)\]"),
+    'src_ip': re.compile(r"(?<=SRC\=)(\d+\.\d+\.\d+\.\d+)"),
+    'dst_ip': re.compile(r"(?<=DST\=)(\d+\.\d+\.\d+\.\d+)"),
+    'protocol': re.compile(r"(?<=PROTO\=)([A-Z]+)"),
+    'src_port': re.compile(r"(?<=SPT\=)(\d+)"),
+    'dst_port': re.compile(r"(?<=DPT\=)(\d+)")
+}
+
+
+def parse_date(d):
+    dt = datetime.datetime.strptime(d, "%b %d %H:%M:%S")
+    dt = dt.replace(year=2017)
+    return dt.strftime("%Y/%m/%d %H:%M:%S")
+
+
+def old_parse(lines):
+    rows = []
+    for l in lines:
+        matches = [rules[name].search(l) for name in ['rule','src_ip','dst_ip','protocol','src_port','dst_port']]
+        if all(matches):
+            rows.append([parse_date(l[:15])] + [m.group(1) for m in matches])
+    return pd.DataFrame(rows, columns=['Date','Rule','SourceIp','DestIp','Proto','SourcePort','DestPort'])
+
+
+def read_lines(path):
+    with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as f:
+        return f.readlines()
+
+
+def test_matches_old_parser(tmp_path, capsys):
+    sources = [os.path.join(FIXTURES, name) for name in ['messages.1.gz', 'messages']]
+    path = str(tmp_path / 'logs.parquet')
+
+    # Small blocks so lines are split across blocks and workers. The second source is an open file, as
+    # when reading over SFTP
+    with open(sources[1], 'rb') as f:
+        rows = parse_logs([sources[0], ('messages', f)], path, year=2017, workers=2, block_size=1000)
+    d = read_logs(path)
+    assert 'Processed messages\n' in capsys.readouterr().out
+
+    expected = old_parse([line for source in sources for line in read_lines(source)])
+    assert rows == len(expected) > 0
+
+    assert (d['Date'].dt.strftime('%Y/%m/%d %H:%M:%S') == expected['Date']).all()
+    assert (format_ip(d['SourceIp']) == expected['SourceIp']).all()
+    assert (format_ip(d['DestIp']) == expected['DestIp']).all()
+    for col in ['Rule','Proto']:
+        assert (d[col] == expected[col]).all()
+    for col in ['SourcePort','DestPort']:
+        assert (d[col].astype(str) == expected[col]).all()